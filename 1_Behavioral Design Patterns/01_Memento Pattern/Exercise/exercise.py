@@ -1,3 +1,10 @@
+import json
+import mmap
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
 
 
 class Document:
@@ -18,12 +25,40 @@ class Document:
         return f"Document(content='{self.content}', font='{self.font_name}', size={self.font_size})"
 
 
+class FontTable:
+    """
+    Shared table of font names. Each distinct name is stored once and
+    mementos only keep its small integer id.
+    """
+    _ids = {}
+    _names = []
+
+    @classmethod
+    def get_id(cls, font_name):
+        font_id = cls._ids.get(font_name)
+        if font_id is None:
+            font_id = cls._ids[font_name] = len(cls._names)
+            cls._names.append(sys.intern(font_name))
+        return font_id
+
+    @classmethod
+    def get_name(cls, font_id):
+        return cls._names[font_id]
+
+
 class DocumentMemento:
+    # No per-instance __dict__; the font name is kept as an id into FontTable
+    __slots__ = ("content", "_font_id", "font_size")
+
     def __init__(self, content, font_name, font_size):
         self.content = content
-        self.font_name = font_name
+        self._font_id = FontTable.get_id(font_name)
         self.font_size = font_size
 
+    @property
+    def font_name(self):
+        return FontTable.get_name(self._font_id)
+
 
 class History:
     def __init__(self):
@@ -38,6 +73,255 @@ class History:
         return None
 
 
+# Spill file used by the bounded caretaker
+class SpillFile:
+    """
+    File of byte records, read back through a memory map. Records are
+    appended at the end and dropped from the end with truncate().
+    """
+    def __init__(self, path=None):
+        self._file = open(path, "w+b") if path else tempfile.TemporaryFile()
+        self._size = 0
+        self._map = None
+
+    def append(self, data):
+        """Writes a record at the end of the file and returns its offset."""
+        offset = self._size
+        self._file.seek(offset)
+        self._file.write(data)
+        self._size += len(data)
+        return offset
+
+    def read(self, offset, length):
+        if length == 0:
+            return b""  # An empty file cannot be mapped
+        if self._map is None or len(self._map) < offset + length:
+            # The file grew since it was mapped
+            self._file.flush()
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length]
+
+    def truncate(self, offset):
+        """Drops every record from `offset` on."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.truncate(offset)
+        self._size = offset
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+class BoundedHistory(History):
+    """
+    History that keeps at most `max_entries` mementos and/or `max_bytes` bytes
+    in memory. Older mementos go to an append-only file and are paged back
+    in by pop().
+    """
+    def __init__(self, max_entries=None, max_bytes=None, spill_path=None):
+        super().__init__()
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._resident = deque()  # (memento, size) pairs, oldest first
+        self._resident_bytes = 0
+        self._spilled = []  # (offset, length) records in the spill file, oldest first
+        self._spilled_bytes = 0
+        self._spill_file = SpillFile(spill_path)
+        self._page_ins = 0
+        self._page_in_seconds = 0.0
+        self._page_in_max = 0.0
+
+    def push(self, memento):
+        size = self._sizeof(memento)
+        self._resident.append((memento, size))
+        self._resident_bytes += size
+        while self._resident and self._over_budget():
+            self._spill_oldest()
+
+    def pop(self):
+        if self._resident:
+            memento, size = self._resident.pop()
+            self._resident_bytes -= size
+            return memento
+        if self._spilled:
+            return self._page_in()
+        return None
+
+    def _over_budget(self):
+        return ((self._max_entries is not None and len(self._resident) > self._max_entries)
+                or (self._max_bytes is not None and self._resident_bytes > self._max_bytes))
+
+    @staticmethod
+    def _sizeof(memento):
+        return sys.getsizeof(memento) + sys.getsizeof(memento.content)
+
+    @staticmethod
+    def _encode(memento):
+        return json.dumps([memento.content, memento.font_name, memento.font_size]).encode("utf-8")
+
+    @staticmethod
+    def _decode(data):
+        return DocumentMemento(*json.loads(data))
+
+    def _spill_oldest(self):
+        memento, size = self._resident.popleft()
+        data = self._encode(memento)
+        self._spilled.append((self._spill_file.append(data), len(data)))
+        self._resident_bytes -= size
+        self._spilled_bytes += len(data)
+
+    def _page_in(self):
+        start = time.perf_counter()
+        offset, length = self._spilled.pop()
+        memento = self._decode(self._spill_file.read(offset, length))
+        self._spilled_bytes -= length
+        # Records are paged in newest first, so the popped one is always last in the file
+        self._spill_file.truncate(offset)
+        elapsed = time.perf_counter() - start
+        self._page_ins += 1
+        self._page_in_seconds += elapsed
+        self._page_in_max = max(self._page_in_max, elapsed)
+        return memento
+
+    def stats(self):
+        """Reports how much history is in memory, how much is on disk, and page-in latency."""
+        return {
+            "resident_entries": len(self._resident),
+            "resident_bytes": self._resident_bytes,
+            "spilled_entries": len(self._spilled),
+            "spilled_bytes": self._spilled_bytes,
+            "page_ins": self._page_ins,
+            "page_in_mean_seconds": self._page_in_seconds / self._page_ins if self._page_ins else 0.0,
+            "page_in_max_seconds": self._page_in_max,
+        }
+
+    def close(self):
+        self._spill_file.close()
+
+
+class _Version:
+    __slots__ = ("id", "parent", "depth", "changes", "is_checkpoint", "children")
+
+    def __init__(self, version_id, parent, depth, changes, is_checkpoint):
+        self.id = version_id
+        self.parent = parent
+        self.depth = depth
+        self.changes = changes  # Field -> value; every field for a checkpoint
+        self.is_checkpoint = is_checkpoint
+        self.children = []
+
+
+class VersionTimeline:
+    """
+    Caretaker that keeps every committed DocumentMemento as a version in a tree.
+    Any version can be restored by id, undo()/redo() move along the current
+    branch, and committing after an undo starts a new branch.
+
+    Each version only stores the fields that changed since its parent, and
+    every `checkpoint_every` levels a full checkpoint is stored, so restoring
+    a version walks at most `checkpoint_every` versions no matter how long
+    the timeline is.
+    """
+    FIELDS = ("content", "font_name", "font_size")
+
+    def __init__(self, checkpoint_every=32):
+        self._checkpoint_every = checkpoint_every
+        self._versions = []
+        self._current = None
+        self._redo_target = {}  # Version id -> child that redo() moves to
+
+    @property
+    def current_version(self):
+        return self._current.id if self._current else None
+
+    def commit(self, memento):
+        """Stores a memento as a child of the current version and returns its id."""
+        parent = self._current
+        values = {field: getattr(memento, field) for field in self.FIELDS}
+        depth = parent.depth + 1 if parent else 0
+        if parent is None or depth % self._checkpoint_every == 0:
+            version = _Version(len(self._versions), parent, depth, values, True)
+        else:
+            previous = self._state(parent)
+            changes = {field: value for field, value in values.items() if previous[field] != value}
+            version = _Version(len(self._versions), parent, depth, changes, False)
+        self._versions.append(version)
+        if parent:
+            parent.children.append(version.id)
+            self._redo_target[parent.id] = version.id
+        self._current = version
+        return version.id
+
+    def restore(self, version_id):
+        """Jumps to any version and returns its memento."""
+        self._current = self._versions[version_id]
+        return self._memento(self._current)
+
+    def undo(self):
+        if self._current is None or self._current.parent is None:
+            return None
+        self._redo_target[self._current.parent.id] = self._current.id
+        self._current = self._current.parent
+        return self._memento(self._current)
+
+    def redo(self):
+        if self._current is None or self._current.id not in self._redo_target:
+            return None
+        return self.restore(self._redo_target[self._current.id])
+
+    def branches(self, version_id):
+        """Returns the ids of the versions committed directly on top of `version_id`."""
+        return list(self._versions[version_id].children)
+
+    def _state(self, version):
+        # Walk up to the nearest checkpoint; the newest value of each field wins
+        state = {}
+        while True:
+            for field, value in version.changes.items():
+                state.setdefault(field, value)
+            if version.is_checkpoint or len(state) == len(self.FIELDS):
+                return state
+            version = version.parent
+
+    def _memento(self, version):
+        state = self._state(version)
+        return DocumentMemento(state["content"], state["font_name"], state["font_size"])
+
+
+def measure_memento_footprint(count=100_000):
+    """
+    Uses tracemalloc to compare bytes per snapshot for a plain __dict__ memento
+    holding its own copy of the font name and the slotted DocumentMemento.
+    The content string is shared, so only the per-snapshot overhead is measured.
+    """
+    class DictDocumentMemento:
+        def __init__(self, content, font_name, font_size):
+            self.content = content
+            self.font_name = font_name
+            self.font_size = font_size
+
+    content = "Hello, World!"
+    font_names = ("aslam", "Courier New")
+    results = {}
+    for label, memento_class in (("__dict__", DictDocumentMemento), ("slotted", DocumentMemento)):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        # Font names read from files or the network arrive as separate string objects
+        snapshots = [memento_class(content, font_names[i % 2].encode().decode(), 12)
+                     for i in range(count)]
+        per_snapshot = (tracemalloc.get_traced_memory()[0] - before) / count
+        tracemalloc.stop()
+        del snapshots
+        results[label] = per_snapshot
+        print(f"{label:>9}: {per_snapshot:6.1f} bytes per snapshot")
+    return results
+
 
 doc = Document()
 history = History()
@@ -60,3 +344,48 @@ print("After Undo 1:", doc)
 
 doc.restore(history.pop())
 print("After Undo 2:", doc)
+
+
+# Bounded history: only the newest memento stays in memory, the rest are on disk
+doc = Document()
+history = BoundedHistory(max_entries=1)
+for size in (10, 11, 12):
+    doc.content = f"Size {size}"
+    doc.font_name = "aslam"
+    doc.font_size = size
+    history.push(doc.create_memento())
+
+memento = history.pop()
+while memento is not None:
+    doc.restore(memento)
+    print("After Undo:", doc)
+    memento = history.pop()
+print(history.stats())
+history.close()
+
+
+# Version timeline: jump to any version, redo, and branch
+doc = Document()
+timeline = VersionTimeline(checkpoint_every=4)
+
+doc.content, doc.font_name, doc.font_size = "Draft", "aslam", 12
+first = timeline.commit(doc.create_memento())
+doc.content = "Draft, revised"
+timeline.commit(doc.create_memento())
+doc.font_size = 16
+timeline.commit(doc.create_memento())
+
+doc.restore(timeline.undo())
+print("After Undo:", doc)
+doc.restore(timeline.redo())
+print("After Redo:", doc)
+
+doc.restore(timeline.restore(first))
+doc.content = "Draft, other branch"
+timeline.commit(doc.create_memento())
+print("Branches from version", first, ":", timeline.branches(first))
+doc.restore(timeline.restore(2))
+print("Version 2:", doc)
+
+if "--benchmark" in sys.argv:
+    measure_memento_footprint()
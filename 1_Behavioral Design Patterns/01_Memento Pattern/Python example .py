@@ -3,10 +3,21 @@ Memento Design Pattern in Python
 
 This script demonstrates the Memento pattern with proper classes:
 - Originator: TextEditor
-- Memento: Memento
-- Caretaker: History
+- Memento: Memento (full copy) and DeltaMemento (only the change since the last save)
+- Caretaker: History, and BoundedHistory which spills old mementos to disk
+- Text buffers: StringBuffer (a plain string) and PieceTable (shares structure with snapshots)
+
+Run with --benchmark to compare full-copy and delta mementos.
 """
 
+import mmap
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+
 # Memento class
 class Memento:
     """
@@ -14,35 +25,200 @@ class Memento:
     Immutable from the outside.
     """
     def __init__(self, text):
-        self._text = text
+        self._text = text  # A string, or the last _Piece of a PieceTable snapshot
 
     def get_saved_state(self):
+        if isinstance(self._text, _Piece):
+            return _piece_text(self._text)
         return self._text
 
+    def _state(self):
+        # What the editor's buffer restores from; no text is built for a piece table
+        return self._text
+
+
+# Delta Memento class
+class DeltaMemento:
+    """
+    Stores only the change since the previous memento:
+    keep the first `keep` characters of the parent state, then append `added`.
+
+    Restoring walks back to the nearest full Memento (a keyframe), so the
+    cost is bounded by the keyframe interval, not by the length of the history.
+    """
+    def __init__(self, parent, keep, added):
+        self._parent = parent
+        self._keep = keep
+        self._added = added
+
+    def get_saved_state(self):
+        # Walk back to the keyframe, remembering how much of each ancestor
+        # is still visible in this state, then build the text with one join.
+        pieces = []
+        need = None  # None means "the whole state"
+        memento = self
+        while isinstance(memento, DeltaMemento):
+            if need is None:
+                pieces.append(memento._added)
+                need = memento._keep
+            elif need > memento._keep:
+                pieces.append(memento._added[:need - memento._keep])
+                need = memento._keep
+            memento = memento._parent
+        base = memento.get_saved_state()
+        pieces.append(base if need is None else base[:need])
+        pieces.reverse()
+        return "".join(pieces)
+
+    def _state(self):
+        return self.get_saved_state()
+
+
+# Text buffers used by the TextEditor
+class StringBuffer:
+    """
+    Keeps the text in a single string. Every append copies the whole text.
+    """
+    def __init__(self, text=""):
+        self._text = text
+
+    def append(self, new_text):
+        self._text += new_text
+
+    def snapshot(self):
+        return self._text
+
+    def restore(self, state):
+        self._text = state if isinstance(state, str) else _piece_text(state)
+
+    def tail(self, start):
+        """Returns the text from position `start` to the end."""
+        return self._text[start:]
+
+    def __len__(self):
+        return len(self._text)
+
+    def __str__(self):
+        return self._text
+
+
+class _Piece:
+    """
+    One appended piece of text. Pieces are immutable and point back to the
+    pieces before them, so a snapshot is simply a reference to the last piece.
+    """
+    __slots__ = ("prev", "text", "length")
+
+    def __init__(self, prev, text, length):
+        self.prev = prev
+        self.text = text
+        self.length = length  # Total length of the text up to and including this piece
+
+
+def _piece_text(piece, start=0):
+    """Returns the text ending at `piece`, from position `start` to the end."""
+    pieces = []
+    while piece is not None and piece.length > start:
+        offset = piece.length - len(piece.text)
+        pieces.append(piece.text if offset >= start else piece.text[start - offset:])
+        piece = piece.prev
+    pieces.reverse()
+    return "".join(pieces)
+
+
+class PieceTable:
+    """
+    Append-only piece table whose pieces are shared with snapshots.
+    append() is O(1) and never copies existing text; snapshot() and
+    restore() are O(1) because they only swap the reference to the last piece.
+    """
+    def __init__(self, text=""):
+        self._head = _Piece(None, text, len(text))
+
+    def append(self, new_text):
+        if new_text:
+            self._head = _Piece(self._head, new_text, self._head.length + len(new_text))
+
+    def snapshot(self):
+        return self._head
+
+    def restore(self, state):
+        if isinstance(state, str):
+            state = _Piece(None, state, len(state))
+        self._head = state
+
+    def tail(self, start):
+        """Returns the text from position `start` to the end."""
+        return _piece_text(self._head, start)
+
+    def __len__(self):
+        return self._head.length
+
+    def __str__(self):
+        text = self.tail(0)
+        # Collapse the pieces so the next read is cheap; older snapshots keep theirs
+        self._head = _Piece(None, text, len(text))
+        return text
+
 
 # Originator class
 class TextEditor:
     """
     The object whose state we want to save and restore.
+
+    By default every save() is a full copy. Pass keyframe_every=K to store
+    delta mementos instead, with a full keyframe every K saves.
+    Pass buffer=PieceTable() to keep the text in a piece table, which makes
+    write() O(1) and lets full mementos share the text instead of copying it.
     """
-    def __init__(self):
-        self._text = ""
+    def __init__(self, keyframe_every=None, buffer=None):
+        self._buffer = buffer if buffer is not None else StringBuffer()
+        self._keyframe_every = keyframe_every
+        self._last_memento = None  # Parent for the next delta memento
+        self._saved_length = 0     # Length of the text at the last save
+        self._deltas_since_keyframe = 0
 
     def write(self, new_text):
         """Appends new text to the editor."""
-        self._text += new_text
+        self._buffer.append(new_text)
 
     def save(self):
         """Returns a Memento containing the current state."""
-        return Memento(self._text)
+        if self._keyframe_every is None:
+            return Memento(self._buffer.snapshot())
+        if (self._last_memento is None
+                or self._deltas_since_keyframe + 1 >= self._keyframe_every):
+            memento = Memento(str(self._buffer))
+            self._deltas_since_keyframe = 0
+        else:
+            # write() only appends, so everything up to the last save is unchanged
+            memento = DeltaMemento(self._last_memento, self._saved_length,
+                                   self._buffer.tail(self._saved_length))
+            self._deltas_since_keyframe += 1
+        self._last_memento = memento
+        self._saved_length = len(self._buffer)
+        return memento
 
     def restore(self, memento):
         """Restores the editor's state from a Memento."""
-        self._text = memento.get_saved_state()
+        self._buffer.restore(memento._state())
+        if self._keyframe_every is not None:
+            # Later deltas are relative to the state we just restored
+            self._last_memento = memento
+            self._saved_length = len(self._buffer)
+            self._deltas_since_keyframe = self._chain_length(memento)
+
+    @staticmethod
+    def _chain_length(memento):
+        length = 0
+        while isinstance(memento, DeltaMemento):
+            memento = memento._parent
+            length += 1
+        return length
 
     def show(self):
         """Prints the current text."""
-        print(self._text)
+        print(self._buffer)
 
 
 # Caretaker class
@@ -63,6 +239,236 @@ class History:
         return self._history.pop()
 
 
+# Spill file used by the bounded caretaker
+class SpillFile:
+    """
+    File of byte records, read back through a memory map. Records are
+    appended at the end and dropped from the end with truncate().
+    """
+    def __init__(self, path=None):
+        self._file = open(path, "w+b") if path else tempfile.TemporaryFile()
+        self._size = 0
+        self._map = None
+
+    def append(self, data):
+        """Writes a record at the end of the file and returns its offset."""
+        offset = self._size
+        self._file.seek(offset)
+        self._file.write(data)
+        self._size += len(data)
+        return offset
+
+    def read(self, offset, length):
+        if length == 0:
+            return b""  # An empty file cannot be mapped
+        if self._map is None or len(self._map) < offset + length:
+            # The file grew since it was mapped
+            self._file.flush()
+            if self._map is not None:
+                self._map.close()
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._map[offset:offset + length]
+
+    def truncate(self, offset):
+        """Drops every record from `offset` on."""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.truncate(offset)
+        self._size = offset
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+# Bounded caretaker
+class BoundedHistory(History):
+    """
+    History with a budget of `max_entries` mementos and/or `max_bytes` bytes
+    kept in memory. Older mementos are spilled to an append-only file and
+    paged back in by undo() once everything newer has been undone.
+
+    A memento that only appends to the previously spilled one (a DeltaMemento
+    on top of it, or a piece-table snapshot that extends it) is spilled as
+    just the appended text. Every `spill_keyframe_every` records a full copy
+    is written, so paging in reads at most that many records.
+    """
+    RECORD_HEADER = struct.Struct(">q")  # Characters kept from the previous record, or -1 for a full copy
+
+    def __init__(self, max_entries=None, max_bytes=None, spill_path=None, spill_keyframe_every=64):
+        super().__init__()
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._spill_keyframe_every = spill_keyframe_every
+        self._resident = deque()  # (memento, size) pairs, oldest first
+        self._resident_bytes = 0
+        self._spilled = []  # (offset, length, records back to a full copy), oldest first
+        self._spilled_bytes = 0
+        self._last_spilled = None  # Memento in the newest record, to spill the next one as a delta
+        self._spill_file = SpillFile(spill_path)
+        self._page_ins = 0
+        self._page_in_seconds = 0.0
+        self._page_in_max = 0.0
+
+    def save_state(self, memento):
+        size = self._sizeof(memento)
+        self._resident.append((memento, size))
+        self._resident_bytes += size
+        while self._resident and self._over_budget():
+            self._spill_oldest()
+
+    def undo(self):
+        if self._resident:
+            memento, size = self._resident.pop()
+            self._resident_bytes -= size
+            return memento
+        if self._spilled:
+            return self._page_in()
+        return None
+
+    def _over_budget(self):
+        return ((self._max_entries is not None and len(self._resident) > self._max_entries)
+                or (self._max_bytes is not None and self._resident_bytes > self._max_bytes))
+
+    @staticmethod
+    def _sizeof(memento):
+        # Only count what this memento adds; text shared with other snapshots is not counted
+        state = memento._state() if isinstance(memento, Memento) else memento._added
+        if isinstance(state, _Piece):
+            state = state.text
+        return sys.getsizeof(state)
+
+    def _delta(self, memento):
+        """Returns (keep, added) if `memento` only appends to the last spilled one, else None."""
+        previous = self._last_spilled
+        if previous is None or self._spilled[-1][2] + 1 >= self._spill_keyframe_every:
+            return None
+        if isinstance(memento, DeltaMemento):
+            if memento._parent is previous:
+                return memento._keep, memento._added
+            return None
+        head = memento._state()
+        if not (isinstance(head, _Piece) and isinstance(previous, Memento)
+                and isinstance(previous._state(), _Piece)):
+            return None
+        # Walk back the pieces appended since the previous snapshot
+        base, pieces, piece = previous._state(), [], head
+        while piece is not None and piece.length > base.length:
+            pieces.append(piece.text)
+            piece = piece.prev
+        if piece is not base:
+            return None
+        pieces.reverse()
+        return base.length, "".join(pieces)
+
+    def _read_record(self, index):
+        offset, length, _ = self._spilled[index]
+        data = self._spill_file.read(offset, length)
+        keep = self.RECORD_HEADER.unpack_from(data)[0]
+        return keep, data[self.RECORD_HEADER.size:].decode("utf-8")
+
+    def _spill_oldest(self):
+        memento, size = self._resident.popleft()
+        delta = self._delta(memento)
+        if delta is None:
+            keep, text, depth = -1, memento.get_saved_state(), 0
+        else:
+            (keep, text), depth = delta, self._spilled[-1][2] + 1
+        data = self.RECORD_HEADER.pack(keep) + text.encode("utf-8")
+        self._spilled.append((self._spill_file.append(data), len(data), depth))
+        self._last_spilled = memento
+        self._resident_bytes -= size
+        self._spilled_bytes += len(data)
+
+    def _page_in(self):
+        start = time.perf_counter()
+        # Walk back to the full copy, keeping only the part of each record still
+        # visible in the newest state, as DeltaMemento.get_saved_state() does
+        index = len(self._spilled) - 1
+        pieces, need = [], None
+        while True:
+            keep, text = self._read_record(index)
+            if keep < 0:
+                break
+            if need is None:
+                pieces.append(text)
+                need = keep
+            elif need > keep:
+                pieces.append(text[:need - keep])
+                need = keep
+            index -= 1
+        pieces.append(text if need is None else text[:need])
+        pieces.reverse()
+        # A paged-in memento is always a full copy, whatever kind was spilled
+        memento = Memento("".join(pieces))
+        offset, length, _ = self._spilled.pop()
+        self._last_spilled = None
+        self._spilled_bytes -= length
+        # Records are paged in newest first, so the popped one is always last in the file
+        self._spill_file.truncate(offset)
+        elapsed = time.perf_counter() - start
+        self._page_ins += 1
+        self._page_in_seconds += elapsed
+        self._page_in_max = max(self._page_in_max, elapsed)
+        return memento
+
+    def stats(self):
+        """Reports how much history is in memory, how much is on disk, and page-in latency."""
+        return {
+            "resident_entries": len(self._resident),
+            "resident_bytes": self._resident_bytes,
+            "spilled_entries": len(self._spilled),
+            "spilled_bytes": self._spilled_bytes,
+            "page_ins": self._page_ins,
+            "page_in_mean_seconds": self._page_in_seconds / self._page_ins if self._page_ins else 0.0,
+            "page_in_max_seconds": self._page_in_max,
+        }
+
+    def close(self):
+        self._spill_file.close()
+
+
+# Benchmark
+def benchmark(saves=100_000, doc_size=1_000_000, chunk=" edit", keyframe_every=64, undos=1_000):
+    """
+    Saves `saves` times on a document of `doc_size` characters, appending
+    `chunk` between saves, then times `undos` undo operations.
+    Reports traced memory held by the history and mean undo latency.
+    """
+    results = {}
+    modes = (
+        ("full copy", None, StringBuffer),
+        (f"delta (K={keyframe_every})", keyframe_every, StringBuffer),
+        ("piece table", None, PieceTable),
+    )
+    for label, interval, buffer_class in modes:
+        editor = TextEditor(keyframe_every=interval, buffer=buffer_class())
+        editor.write("x" * doc_size)
+        history = History()
+
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        for _ in range(saves):
+            editor.write(chunk)
+            history.save_state(editor.save())
+        held = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+
+        count = min(undos, saves)
+        start = time.perf_counter()
+        for _ in range(count):
+            editor.restore(history.undo())
+        latency = (time.perf_counter() - start) / count
+
+        results[label] = (held, latency)
+        print(f"{label:>16}: {held / 2**20:10.1f} MiB held, {latency * 1e6:10.1f} us per undo")
+        del editor, history
+    return results
+
+
 # Example usage
 if __name__ == "__main__":
     editor = TextEditor()
@@ -76,3 +482,46 @@ if __name__ == "__main__":
 
     editor.restore(history.undo())  # Undo to previous state
     editor.show()  # Output: Hello
+
+    # Delta mementos: only the appended text is stored between keyframes
+    editor = TextEditor(keyframe_every=3)
+    history = History()
+    for word in ("one", " two", " three", " four"):
+        editor.write(word)
+        history.save_state(editor.save())
+    editor.write(" five")
+
+    editor.restore(history.undo())
+    editor.show()  # Output: one two three four
+    editor.restore(history.undo())
+    editor.show()  # Output: one two three
+
+    # Piece table: saves share the text with the live buffer instead of copying it
+    editor = TextEditor(buffer=PieceTable())
+    history = History()
+    editor.write("Hello")
+    history.save_state(editor.save())
+    editor.write(", World!")
+    editor.show()  # Output: Hello, World!
+    editor.restore(history.undo())
+    editor.show()  # Output: Hello
+
+    # Bounded history: only the two newest mementos stay in memory
+    editor = TextEditor()
+    history = BoundedHistory(max_entries=2)
+    for word in ("one", " two", " three", " four"):
+        editor.write(word)
+        history.save_state(editor.save())
+    while True:
+        memento = history.undo()
+        if memento is None:
+            break
+        editor.restore(memento)
+        editor.show()  # Output: one two three four, one two three, one two, one
+    print(history.stats())
+    history.close()
+
+    if "--benchmark" in sys.argv:
+        # A full copy of a 1 MB document per save needs ~100 GB for 100k saves,
+        # so the default run is scaled down; call benchmark() directly for more.
+        benchmark(saves=2_000, doc_size=1_000_000)
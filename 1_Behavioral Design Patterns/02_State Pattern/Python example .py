@@ -1,7 +1,24 @@
+import asyncio
+import heapq
+import io
+import itertools
+import os
+import sys
+import time
 from abc import ABC, abstractmethod
+from contextlib import redirect_stdout
 
 # State Interface
 class State(ABC):
+    @classmethod
+    def shared(cls):
+        """Returns the one shared instance of this state (states hold no data)."""
+        instance = cls.__dict__.get("_shared_instance")
+        if instance is None:
+            instance = cls()
+            cls._shared_instance = instance
+        return instance
+
     @abstractmethod
     def click_play(self, player):
         pass
@@ -10,21 +27,240 @@ class State(ABC):
 class PlayingState(State):
     def click_play(self, player):
         print("Pausing the music.")
-        player.state = PausedState()
+        player.state = PausedState.shared()
 
 class PausedState(State):
     def click_play(self, player):
         print("Resuming the music.")
-        player.state = PlayingState()
+        player.state = PlayingState.shared()
 
 # Context
 class MusicPlayer:
     def __init__(self):
-        self.state = PausedState()  # Default state
+        self.state = PausedState.shared()  # Default state
 
     def click_play(self):
         self.state.click_play(self)
 
+
+# State Machine Engine
+class _Probe:
+    """Stand-in context used to find out which state a handler switches to."""
+    def __init__(self, state):
+        self.state = state
+
+
+class StateMachine:
+    """
+    Compiles State subclasses into a transition table of integer state ids.
+    Each handler is called once per state on a probe context, so handlers must
+    always switch to the same state; their printed output is discarded.
+    """
+    def __init__(self, states, events=("click_play",)):
+        if len(states) > 256:
+            raise ValueError("StateMachine supports at most 256 states")
+        self.states = [state_class.shared() for state_class in states]
+        self.events = tuple(events)
+        self._ids = {type(state): state_id for state_id, state in enumerate(self.states)}
+        self._next = {}    # Event -> next state id for every state id
+        self._tables = {}  # Event -> 256-byte table for bytearray.translate
+        for event in self.events:
+            next_ids = [self._probe(state, event) for state in self.states]
+            self._next[event] = next_ids
+            self._tables[event] = bytes(next_ids) + bytes(range(len(next_ids), 256))
+
+    def _probe(self, state, event):
+        probe = _Probe(state)
+        with redirect_stdout(io.StringIO()):
+            getattr(state, event)(probe)
+        return self._ids[type(probe.state)]
+
+    def state_id(self, state_class):
+        return self._ids[state_class]
+
+    def step(self, state_id, event):
+        """Returns the id of the state that `event` moves `state_id` to."""
+        return self._next[event][state_id]
+
+    def table(self, event):
+        return self._tables[event]
+
+
+class PlayerBatch:
+    """
+    Many MusicPlayer contexts stored as one byte of state id each.
+    dispatch() advances every player with a single bytearray.translate call.
+    Handlers are not run, so their side effects (the printed messages) are skipped.
+    """
+    def __init__(self, machine, count, initial_state=PausedState):
+        self._machine = machine
+        self._states = bytearray([machine.state_id(initial_state)]) * count
+
+    def dispatch(self, event):
+        self._states = self._states.translate(self._machine.table(event))
+
+    def state(self, index):
+        return self._machine.states[self._states[index]]
+
+    def count(self, state_class):
+        return self._states.count(self._machine.state_id(state_class))
+
+    def __len__(self):
+        return len(self._states)
+
+
+# Timed Transitions
+class ScheduledTransition:
+    """A transition waiting in the TransitionScheduler heap. Call cancel() to drop it."""
+    __slots__ = ("scheduler", "deadline", "context", "event", "only_in", "cancelled")
+
+    def __init__(self, scheduler, deadline, context, event, only_in):
+        self.scheduler = scheduler
+        self.deadline = deadline
+        self.context = context
+        self.event = event
+        self.only_in = only_in
+        self.cancelled = False
+
+    def cancel(self):
+        self.scheduler.cancel(self)
+
+
+class TransitionScheduler:
+    """
+    Fires delayed transitions (e.g. auto-pause after N idle seconds) for any
+    number of contexts. All transitions share one heap, and only the earliest
+    deadline is registered with the asyncio event loop, so 100k pending
+    transitions cost one loop timer instead of 100k tasks.
+    """
+    def __init__(self):
+        self._heap = []  # (deadline, sequence, ScheduledTransition)
+        self._sequence = itertools.count()
+        self._timer = None
+        self._timer_deadline = None
+        self._pending = 0
+        self._cancelled = 0  # Cancelled entries still sitting in the heap
+        self._fired = 0
+        self._failed = 0
+        self._lateness_total = 0.0
+        self._lateness_max = 0.0
+
+    def schedule(self, context, delay, event="click_play", only_in=None):
+        """
+        Calls `context.<event>()` after `delay` seconds. With `only_in`, the
+        transition is skipped unless the context is still in that state class.
+        Must be called while the event loop is running.
+        """
+        loop = asyncio.get_running_loop()
+        transition = ScheduledTransition(self, loop.time() + delay, context, event, only_in)
+        heapq.heappush(self._heap, (transition.deadline, next(self._sequence), transition))
+        self._pending += 1
+        self._arm(loop)
+        return transition
+
+    def cancel(self, transition):
+        if transition.cancelled:
+            return
+        transition.cancelled = True
+        self._pending -= 1
+        self._cancelled += 1
+        # Entries are removed lazily; rebuild once they make up most of the heap
+        if self._cancelled > len(self._heap) // 2:
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+
+    def _arm(self, loop):
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1
+        if not self._heap:
+            return
+        deadline = self._heap[0][0]
+        if self._timer is not None:
+            if self._timer_deadline <= deadline:
+                return
+            self._timer.cancel()
+        self._timer = loop.call_at(deadline, self._run_due, loop)
+        self._timer_deadline = deadline
+
+    def _run_due(self, loop):
+        self._timer = None
+        now = loop.time()
+        try:
+            while self._heap and self._heap[0][0] <= now:
+                _, _, transition = heapq.heappop(self._heap)
+                if transition.cancelled:
+                    self._cancelled -= 1
+                    continue
+                transition.cancelled = True  # A fired transition can no longer be cancelled
+                self._pending -= 1
+                self._fired += 1
+                lateness = now - transition.deadline
+                self._lateness_total += lateness
+                self._lateness_max = max(self._lateness_max, lateness)
+                context = transition.context
+                if transition.only_in is None or isinstance(context.state, transition.only_in):
+                    try:
+                        getattr(context, transition.event)()
+                    except Exception as error:
+                        # One failing context must not strand the others' transitions
+                        self._failed += 1
+                        loop.call_exception_handler({
+                            "message": f"Scheduled transition {transition.event!r} failed",
+                            "exception": error,
+                        })
+        finally:
+            self._arm(loop)
+
+    def metrics(self):
+        return {
+            "pending_timers": self._pending,
+            "fired": self._fired,
+            "failed": self._failed,
+            "lateness_mean_seconds": self._lateness_total / self._fired if self._fired else 0.0,
+            "lateness_max_seconds": self._lateness_max,
+        }
+
+
+async def benchmark_scheduler(contexts=100_000, delay=0.5):
+    """Schedules one auto-pause per player and waits for all of them to fire."""
+    scheduler = TransitionScheduler()
+    players = [MusicPlayer() for _ in range(contexts)]
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        start = time.perf_counter()
+        for player in players:
+            player.click_play()
+            scheduler.schedule(player, delay, only_in=PlayingState)
+        scheduled = time.perf_counter() - start
+        await asyncio.sleep(delay * 2)
+    print(f"scheduled {contexts:,} transitions in {scheduled:.3f}s; {scheduler.metrics()}")
+
+
+# Benchmark
+def benchmark(players=10_000, events=100):
+    """Compares events per second for per-object MusicPlayer calls and a PlayerBatch."""
+    machine = StateMachine([PausedState, PlayingState])
+
+    contexts = [MusicPlayer() for _ in range(players)]
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        start = time.perf_counter()
+        for _ in range(events):
+            for player in contexts:
+                player.click_play()
+        per_object = players * events / (time.perf_counter() - start)
+
+    batch = PlayerBatch(machine, players)
+    start = time.perf_counter()
+    for _ in range(events):
+        batch.dispatch("click_play")
+    batched = players * events / (time.perf_counter() - start)
+
+    print(f"per-object: {per_object:15,.0f} events/s")
+    print(f"     batch: {batched:15,.0f} events/s")
+    return per_object, batched
+
+
 # Example Usage
 if __name__ == "__main__":
     player = MusicPlayer()
@@ -32,3 +268,24 @@ if __name__ == "__main__":
     player.click_play()  # Output: Resuming the music.
     player.click_play()  # Output: Pausing the music.
     player.click_play()  # Output: Resuming the music.
+
+    # Batch mode: advance many players with one operation per event
+    machine = StateMachine([PausedState, PlayingState])
+    batch = PlayerBatch(machine, 5)
+    batch.dispatch("click_play")
+    print(f"Playing: {batch.count(PlayingState)}, Paused: {batch.count(PausedState)}")  # Playing: 5, Paused: 0
+
+    # Timed transition: pause automatically after 0.1 seconds of playing
+    async def auto_pause_demo():
+        scheduler = TransitionScheduler()
+        player = MusicPlayer()
+        player.click_play()  # Output: Resuming the music.
+        scheduler.schedule(player, 0.1, only_in=PlayingState)
+        print("Pending timers:", scheduler.metrics()["pending_timers"])  # Pending timers: 1
+        await asyncio.sleep(0.2)  # Output: Pausing the music.
+
+    asyncio.run(auto_pause_demo())
+
+    if "--benchmark" in sys.argv:
+        benchmark()
+        asyncio.run(benchmark_scheduler())
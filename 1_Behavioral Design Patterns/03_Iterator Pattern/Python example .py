@@ -5,40 +5,472 @@ when dealing with multiple data structures, as it provides a
 consistent interface for iteration, keeping the complexity 
 hidden from the user.
 
+Iterators work on a snapshot of the history: URLs pushed or popped while
+iterating do not change what an existing iterator sees.
+
+BrowseHistory(indexed=True) also keeps a UrlIndex for prefix and domain lookups.
+MappedBrowseHistory keeps the same interface on disk: URLs go to an
+append-only log file and their offsets to an index file, both read through mmap.
+
+Run with --benchmark to compare per-item and chunked iteration.
 """
 
 
 
-from typing import List, Any, Iterator
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+from array import array
+from bisect import bisect_left
+from typing import List, Any, Iterator, Tuple
 
-class BrowseHistory:
+class UrlIndex:
+    """
+    Index over the URLs of a BrowseHistory, kept up to date by push() and pop().
+
+    - URLs (without the scheme) are kept in sorted runs whose sizes double,
+      like a binary counter, so adding a URL is amortized O(log n) and a prefix
+      query is a binary search in each of the O(log n) runs.
+    - Each domain has a posting list of the positions where it was visited.
+    - Each URL has a stack of the positions where it was visited; the top is
+      its most recent visit.
+    - URLs whose visits were all popped stay in the runs until the next merge
+      drops them, or until they outnumber the live URLs and the runs are rebuilt.
+    """
     def __init__(self):
+        self._runs: List[List[str]] = []
+        self._positions = {}  # URL key -> visit position, or array of them (ascending) if several
+        self._dead = set()    # URL keys still in the runs but with no visits left
+        self._domains = {}    # Domain -> array of visit positions, ascending
+
+    @staticmethod
+    def _key(url: str) -> str:
+        scheme, separator, rest = url.partition("://")
+        return rest if separator else url
+
+    @staticmethod
+    def _domain(key: str) -> str:
+        return key.partition("/")[0]
+
+    def add(self, url: str, position: int):
+        key = self._key(url)
+        positions = self._positions.get(key)
+        if positions is None:
+            # Most URLs are visited once, so a single position is stored as a plain int
+            self._positions[key] = position
+            if key in self._dead:
+                self._dead.discard(key)
+            else:
+                self._insert(key)
+        elif type(positions) is int:
+            self._positions[key] = array("q", (positions, position))
+        else:
+            positions.append(position)
+        domain = self._domain(key)
+        postings = self._domains.get(domain)
+        if postings is None:
+            postings = self._domains[domain] = array("q")
+        postings.append(position)
+
+    def remove(self, url: str, position: int):
+        """Removes the visit at `position`, which must be the newest one."""
+        key = self._key(url)
+        domain = self._domain(key)
+        postings = self._domains[domain]
+        postings.pop()
+        if not postings:
+            del self._domains[domain]
+        positions = self._positions[key]
+        if type(positions) is not int:
+            positions.pop()
+            if len(positions) == 1:
+                self._positions[key] = positions[0]
+            return
+        del self._positions[key]
+        self._dead.add(key)
+        if len(self._dead) > len(self._positions):
+            self._compact()
+
+    def _insert(self, key: str):
+        run = [key]
+        while self._runs and len(self._runs[-1]) <= len(run):
+            # sorted() finds the two existing runs and merges them in linear time
+            older = self._runs.pop()
+            if self._dead:
+                older = self._drop_dead(older)
+            run = sorted(older + run)
+        self._runs.append(run)
+
+    def _drop_dead(self, run: List[str]) -> List[str]:
+        dead = self._dead
+        live = [key for key in run if key not in dead]
+        if len(live) < len(run):
+            dead.difference_update(run)  # Only the keys in this run can be dead here
+        return live
+
+    def _compact(self):
+        # Dead keys are the majority: rebuild one run from the live keys
+        self._runs = [sorted(self._positions)] if self._positions else []
+        self._dead.clear()
+
+    def urls_with_prefix(self, prefix: str, limit: int = None) -> List[str]:
+        """Returns visited URL keys starting with `prefix` (the scheme is ignored)."""
+        prefix = self._key(prefix)
+        found = []
+        for run in self._runs:
+            index = bisect_left(run, prefix)
+            while index < len(run) and run[index].startswith(prefix):
+                if run[index] in self._positions:
+                    found.append(run[index])
+                    if limit is not None and len(found) >= limit:
+                        return sorted(found)
+                index += 1
+        return sorted(found)
+
+    def has_prefix(self, prefix: str) -> bool:
+        return bool(self.urls_with_prefix(prefix, limit=1))
+
+    def domain_count(self, domain: str) -> int:
+        """Number of visits to `domain`."""
+        postings = self._domains.get(domain)
+        return len(postings) if postings else 0
+
+    def last_visit(self, url: str):
+        """Position of the most recent visit to `url`, or None."""
+        positions = self._positions.get(self._key(url))
+        if positions is None or type(positions) is int:
+            return positions
+        return positions[-1]
+
+    def last_domain_visit(self, domain: str):
+        """Position of the most recent visit to any page on `domain`, or None."""
+        postings = self._domains.get(domain)
+        return postings[-1] if postings else None
+
+    def memory_usage(self) -> int:
+        """Approximate bytes used by the index, including its copies of the URL keys."""
+        total = sum(sys.getsizeof(run) for run in self._runs)
+        total += sys.getsizeof(self._positions) + sys.getsizeof(self._dead) + sys.getsizeof(self._domains)
+        total += sum(sys.getsizeof(key) for key in self._positions)
+        total += sum(sys.getsizeof(key) for key in self._dead)
+        total += sum(sys.getsizeof(positions) for positions in self._positions.values()
+                     if type(positions) is not int)
+        total += sum(sys.getsizeof(domain) + sys.getsizeof(postings)
+                     for domain, postings in self._domains.items())
+        return total
+
+class BrowseHistory:
+    def __init__(self, indexed: bool = False):
         self._urls: List[str] = []
+        self._shared = False  # True once a snapshot may be reading _urls
+        self.index = UrlIndex() if indexed else None
 
     def push(self, url: str):
+        if self.index is not None:
+            self.index.add(url, len(self._urls))
+        # Snapshots only read up to their own length, so appending is always safe
         self._urls.append(url)
 
     def pop(self) -> str:
-        return self._urls.pop()
+        if self._shared:
+            # Copy on write: existing snapshots keep the list they started with
+            self._urls = self._urls[:]
+            self._shared = False
+        url = self._urls.pop()
+        if self.index is not None:
+            self.index.remove(url, len(self._urls))
+        return url
 
     def create_iterator(self) -> Iterator:
         return BrowseHistoryIterator(self)
 
+    def iter_chunks(self, size: int) -> Iterator[List[str]]:
+        """Yields the URLs of a snapshot as lists of up to `size` items."""
+        urls, end = self._snapshot()
+        # Taken here rather than inside a generator so the snapshot is fixed at call time
+        return (urls[start:min(start + size, end)] for start in range(0, end, size))
+
+    def __reversed__(self) -> Iterator[str]:
+        urls, _ = self._snapshot()
+        # A list reverse iterator fixes its start position when it is created
+        return reversed(urls)
+
+    def __getitem__(self, index):
+        """Returns one URL, or a list of URLs for a slice such as history[10:20]."""
+        return self._urls[index]
+
+    def __len__(self) -> int:
+        return len(self._urls)
+
+    def _snapshot(self) -> Tuple[List[str], int]:
+        self._shared = True
+        return self._urls, len(self._urls)
+
 class BrowseHistoryIterator:
     def __init__(self, history: BrowseHistory):
-        self._history = history
+        self._urls, self._end = history._snapshot()
         self._index = 0
 
     def __iter__(self):
         return self
 
     def __next__(self) -> str:
-        if self._index < len(self._history._urls):
-            url = self._history._urls[self._index]
+        if self._index < self._end:
+            url = self._urls[self._index]
             self._index += 1
             return url
         raise StopIteration
 
+class MappedBrowseHistory:
+    """
+    BrowseHistory stored in two files so it survives restarts and does not
+    have to fit in memory:
+
+    - `<path>.log`: the URLs, each as a 4-byte length followed by UTF-8 bytes
+    - `<path>.idx`: an 8-byte URL count, then the 8-byte log offset of every URL
+
+    Opening only reads the count, so it takes the same time for any size.
+    Reads go through mmap. Pushing keeps running iterators valid; popping
+    invalidates them, like changing a dict while iterating over it.
+    """
+    _LENGTH = struct.Struct("<I")
+    _OFFSET = struct.Struct("<Q")
+
+    def __init__(self, path: str):
+        self._log = self._open(path + ".log")
+        self._idx = self._open(path + ".idx")
+        self._log_map = None
+        self._idx_map = None
+        self._dirty = False
+        self._generation = 0  # Bumped by pop() to invalidate running iterators
+        header = self._idx.read(self._OFFSET.size)
+        count = self._OFFSET.unpack(header)[0] if len(header) == self._OFFSET.size else 0
+        # After a crash the count can be ahead of records that never reached
+        # disk; step back to the newest record that is complete in both files
+        idx_size = os.fstat(self._idx.fileno()).st_size
+        log_size = os.fstat(self._log.fileno()).st_size
+        self._count = max(min(count, idx_size // self._OFFSET.size - 1), 0)
+        self._log_end = 0
+        while self._count:
+            offset = self._offset(self._count - 1)
+            if offset + self._LENGTH.size <= log_size:
+                end = offset + self._LENGTH.size + self._LENGTH.unpack_from(self._log_map, offset)[0]
+                if end <= log_size:
+                    self._log_end = end
+                    break
+            self._count -= 1
+
+    @staticmethod
+    def _open(path):
+        if not os.path.exists(path):
+            open(path, "wb").close()
+        return open(path, "r+b")
+
+    def push(self, url: str):
+        data = url.encode("utf-8")
+        self._log.seek(self._log_end)
+        self._log.write(self._LENGTH.pack(len(data)))
+        self._log.write(data)
+        self._idx.seek(self._OFFSET.size * (self._count + 1))
+        self._idx.write(self._OFFSET.pack(self._log_end))
+        self._log_end += self._LENGTH.size + len(data)
+        self._count += 1
+        # Keep the stored count current so records are not lost if close() never runs
+        self._write_count()
+        self._dirty = True
+
+    def pop(self) -> str:
+        if not self._count:
+            raise IndexError("pop from empty history")
+        url = self[self._count - 1]
+        self._count -= 1
+        self._log_end = self._offset(self._count) if self._count else 0
+        self._generation += 1
+        # The files are not truncated while they may be mapped; the stored count
+        # decides which records exist and the next push overwrites the old one
+        self._write_count()
+        return url
+
+    def create_iterator(self) -> Iterator:
+        return BrowseHistoryIterator(self)
+
+    def iter_chunks(self, size: int) -> Iterator[List[str]]:
+        """Yields the URLs as lists of up to `size` items, reading each chunk in one pass."""
+        view, end = self._snapshot()
+        return (view[start:min(start + size, end)] for start in range(0, end, size))
+
+    def __reversed__(self) -> Iterator[str]:
+        view, end = self._snapshot()
+        return (view[index] for index in range(end - 1, -1, -1))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self._count)
+            if step != 1:
+                return [self[i] for i in range(start, stop, step)]
+            return self._read_range(start, stop)
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError("history index out of range")
+        offset = self._offset(index)
+        length = self._LENGTH.unpack_from(self._log_map, offset)[0]
+        start = offset + self._LENGTH.size
+        return self._log_map[start:start + length].decode("utf-8")
+
+    def __len__(self) -> int:
+        return self._count
+
+    def flush(self):
+        """Writes the URL count and any buffered records to disk."""
+        self._write_count()
+        self._log.flush()
+        self._idx.flush()
+
+    def close(self):
+        self.flush()
+        for mapped in (self._log_map, self._idx_map):
+            if mapped is not None:
+                mapped.close()
+        self._log_map = self._idx_map = None
+        self._log.close()
+        self._idx.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write_count(self):
+        self._idx.seek(0)
+        self._idx.write(self._OFFSET.pack(self._count))
+
+    def _snapshot(self):
+        return _MappedSnapshot(self, self._generation), self._count
+
+    def _offset(self, index):
+        self._ensure_mapped()
+        return self._OFFSET.unpack_from(self._idx_map, self._OFFSET.size * (index + 1))[0]
+
+    def _read_range(self, start, stop):
+        if start >= stop:
+            return []
+        self._ensure_mapped()
+        offsets = array("Q")
+        offsets.frombytes(self._idx_map[self._OFFSET.size * (start + 1):self._OFFSET.size * (stop + 1)])
+        if sys.byteorder != "little":
+            offsets.byteswap()
+        log_map = self._log_map
+        unpack_length = self._LENGTH.unpack_from
+        header = self._LENGTH.size
+        urls = []
+        for offset in offsets:
+            length = unpack_length(log_map, offset)[0]
+            urls.append(log_map[offset + header:offset + header + length].decode("utf-8"))
+        return urls
+
+    def _ensure_mapped(self):
+        if self._dirty:
+            self._log.flush()
+            self._idx.flush()
+            self._dirty = False
+        self._log_map = self._remap(self._log, self._log_map)
+        self._idx_map = self._remap(self._idx, self._idx_map)
+
+    @staticmethod
+    def _remap(file, mapped):
+        size = os.fstat(file.fileno()).st_size
+        if mapped is not None and len(mapped) == size:
+            return mapped
+        if mapped is not None:
+            mapped.close()
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+
+class _MappedSnapshot:
+    """Read view used by iterators over a MappedBrowseHistory."""
+    def __init__(self, history: MappedBrowseHistory, generation: int):
+        self._history = history
+        self._generation = generation
+
+    def __getitem__(self, index):
+        if self._history._generation != self._generation:
+            raise RuntimeError("BrowseHistory was popped during iteration")
+        return self._history[index]
+
+
+# --- Benchmark ---
+def benchmark_mapped(count: int = 1_000_000, samples: int = 100_000):
+    """Writes `count` URLs, then times cold open and random access."""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "history")
+        with MappedBrowseHistory(path) as history:
+            for i in range(count):
+                history.push(f"https://example.com/page/{i}")
+
+        start = time.perf_counter()
+        history = MappedBrowseHistory(path)
+        opened = time.perf_counter() - start
+
+        indexes = [random.randrange(count) for _ in range(samples)]
+        start = time.perf_counter()
+        for index in indexes:
+            history[index]
+        lookup = (time.perf_counter() - start) / samples
+        history.close()
+    print(f"cold open: {opened * 1e3:.2f} ms, random access: {lookup * 1e6:.2f} us for {count:,} URLs")
+    return opened, lookup
+
+
+def benchmark_index(count: int = 10_000_000, queries: int = 10_000):
+    """Times prefix, domain and most-recent-visit queries on an indexed history."""
+    history = BrowseHistory(indexed=True)
+    for i in range(count):
+        history.push(f"https://site{i % 1000}.com/org{i % 97}/page/{i}")
+    index = history.index
+
+    timings = {}
+    for name, query in (
+        ("has_prefix", lambda i: index.has_prefix(f"site{i % 1000}.com/org{i % 97}/")),
+        ("domain_count", lambda i: index.domain_count(f"site{i % 1000}.com")),
+        ("last_visit", lambda i: index.last_visit(f"https://site{i % 1000}.com/org{i % 97}/page/{i}")),
+    ):
+        start = time.perf_counter()
+        for i in range(queries):
+            query(random.randrange(count))
+        timings[name] = (time.perf_counter() - start) / queries
+        print(f"{name:>12}: {timings[name] * 1e6:8.2f} us")
+    print(f"index memory: {index.memory_usage() / 2**20:.1f} MiB for {count:,} URLs")
+    return timings
+
+
+def benchmark(count: int = 10_000_000, chunk_size: int = 4096):
+    """Compares per-item iteration with iter_chunks over `count` URLs."""
+    history = BrowseHistory()
+    for i in range(count):
+        history.push(f"https://example.com/page/{i}")
+
+    start = time.perf_counter()
+    total = 0
+    for url in history.create_iterator():
+        total += len(url)
+    per_item = time.perf_counter() - start
+
+    start = time.perf_counter()
+    chunked_total = 0
+    for chunk in history.iter_chunks(chunk_size):
+        chunked_total += sum(map(len, chunk))
+    chunked = time.perf_counter() - start
+
+    assert total == chunked_total
+    print(f"per-item: {per_item:.3f}s, chunked: {chunked:.3f}s for {count:,} URLs")
+    return per_item, chunked
+
 # --- Client Code ---
 if __name__ == "__main__":
     history = BrowseHistory()
@@ -48,3 +480,36 @@ if __name__ == "__main__":
 
     for url in history.create_iterator():
         print(url)
+
+    # Iterators keep their snapshot while the history changes
+    iterator = history.create_iterator()
+    history.pop()
+    history.push("python.org")
+    print(list(iterator))         # ['google.com', 'github.com', 'openai.com']
+    print(list(reversed(history)))  # ['python.org', 'github.com', 'google.com']
+    print(list(history.iter_chunks(2)))  # [['google.com', 'github.com'], ['python.org']]
+    print(history[1:])            # ['github.com', 'python.org']
+
+    # Indexed history: prefix and domain lookups without scanning
+    indexed = BrowseHistory(indexed=True)
+    for url in ("https://github.com/org/repo", "https://github.com/other", "https://openai.com"):
+        indexed.push(url)
+    print(indexed.index.has_prefix("github.com/org/"))  # True
+    print(indexed.index.domain_count("github.com"))     # 2
+    print(indexed.index.last_domain_visit("github.com"))  # 1
+
+    # The same history kept on disk: it is still there after reopening
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "history")
+        with MappedBrowseHistory(path) as stored:
+            for url in ("google.com", "github.com", "openai.com"):
+                stored.push(url)
+        with MappedBrowseHistory(path) as stored:
+            print(len(stored), stored[-1])  # 3 openai.com
+            for url in stored.create_iterator():
+                print(url)
+
+    if "--benchmark" in sys.argv:
+        benchmark(count=1_000_000)
+        benchmark_mapped()
+        benchmark_index(count=1_000_000)
@@ -3,9 +3,24 @@
 # This script demonstrates the Strategy Design Pattern.
 # The Strategy Pattern allows the behavior of a class to be selected at runtime.
 # In this example, we use different payment methods (strategies) for a shopping cart.
+#
+# BatchCheckout runs the checkout of many carts concurrently on a thread pool.
+# StrategyRouter is itself a strategy that picks the fastest healthy provider per payment.
+# LineItems stores cart lines in integer-cent arrays; run with --benchmark to time it.
 
 
+import operator
+import os
+import random
+import sys
+import threading
+import time
 from abc import ABC, abstractmethod
+from array import array
+from collections import deque
+from contextlib import redirect_stdout
+from itertools import compress
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 
 # Strategy Interface
 class PaymentStrategy(ABC):
@@ -30,11 +45,236 @@ class PayPalPayment(PaymentStrategy):
     def pay(self, amount):
         print(f"Paid ${amount} using PayPal ({self.email}).")
 
+# Local stub gateway, useful for testing batch checkout without a real provider
+class PaymentError(Exception):
+    pass
+
+class StubGatewayPayment(PaymentStrategy):
+    def __init__(self, latency=0.01, failure_rate=0.0, seed=None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.payments = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def pay(self, amount):
+        time.sleep(self.latency)  # Simulated network round trip
+        with self._lock:
+            if self._random.random() < self.failure_rate:
+                raise PaymentError(f"Gateway declined payment of ${amount}")
+            self.payments += 1
+
+# Adaptive strategy: routes each payment to the fastest healthy strategy
+class _StrategyHealth:
+    """Rolling latency and error statistics plus circuit-breaker state for one strategy."""
+    def __init__(self, strategy, window):
+        self.strategy = strategy
+        self.latencies = deque(maxlen=window)  # Successful calls only; used for reporting percentiles
+        self.average_latency = None  # Moving average of successful calls, used for routing
+        self.error_rate = 0.0  # Moving average of failures, used for routing
+        self.calls = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.trial_running = False  # A half-open circuit lets one call through
+
+class StrategyRouter(PaymentStrategy):
+    """
+    Payment strategy that sends each payment to one of several strategies.
+
+    Most payments go to the healthy strategy with the lowest moving-average
+    latency, skipping strategies whose moving-average error rate is above
+    `max_error_rate` while any other is available; a fraction `epsilon` goes
+    to a random healthy one so a recovered provider gets noticed. After `failure_threshold` consecutive failures a
+    strategy's circuit opens for `cooldown` seconds, then one trial call decides
+    whether it closes again. Routing costs O(number of strategies) per payment,
+    independent of how many payments have been made.
+    """
+    def __init__(self, strategies, epsilon=0.05, failure_threshold=3, cooldown=5.0,
+                 window=1000, smoothing=0.1, max_error_rate=0.2, clock=time.monotonic, rng=None):
+        self._health = [_StrategyHealth(strategy, window) for strategy in strategies]
+        self.epsilon = epsilon
+        self.max_error_rate = max_error_rate
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.smoothing = smoothing
+        self._clock = clock
+        self._random = rng or random.Random()
+        self._lock = threading.Lock()
+
+    def pay(self, amount):
+        health = self._choose()
+        start = self._clock()
+        failed = True
+        try:
+            health.strategy.pay(amount)
+            failed = False
+        finally:
+            # Also runs for KeyboardInterrupt and the like, so a half-open trial is always released
+            self._record(health, self._clock() - start, failed=failed)
+
+    def _choose(self):
+        with self._lock:
+            now = self._clock()
+            healthy = []
+            for health in self._health:
+                if health.open_until <= now and not health.trial_running:
+                    healthy.append(health)
+            if not healthy:
+                raise PaymentError("No healthy payment strategy available")
+            if self._random.random() < self.epsilon:
+                chosen = self._random.choice(healthy)
+            else:
+                # Fast but flaky strategies only get traffic when nothing else is left
+                reliable = [health for health in healthy if health.error_rate <= self.max_error_rate]
+                # Strategies without measurements yet are tried first
+                chosen = min(reliable or healthy, key=lambda health: health.average_latency or 0.0)
+            if chosen.open_until:
+                chosen.trial_running = True
+            return chosen
+
+    def _record(self, health, latency, failed):
+        with self._lock:
+            health.calls += 1
+            if not failed:
+                # Failures are often fast; counting them would make a flaky strategy look good
+                health.latencies.append(latency)
+                if health.average_latency is None:
+                    health.average_latency = latency
+                else:
+                    health.average_latency += self.smoothing * (latency - health.average_latency)
+            health.error_rate += self.smoothing * (float(failed) - health.error_rate)
+            health.trial_running = False
+            if failed:
+                health.consecutive_failures += 1
+                if health.open_until or health.consecutive_failures >= self.failure_threshold:
+                    health.open_until = self._clock() + self.cooldown
+            else:
+                health.consecutive_failures = 0
+                health.open_until = 0.0
+
+    def stats(self):
+        """Returns p50/p99 latency, error rate and circuit state for every strategy."""
+        with self._lock:
+            now = self._clock()
+            report = []
+            for health in self._health:
+                latencies = sorted(health.latencies)
+                if health.trial_running:
+                    circuit = "half-open"
+                elif health.open_until > now:
+                    circuit = "open"
+                else:
+                    circuit = "closed"
+                report.append({
+                    "strategy": type(health.strategy).__name__,
+                    "calls": health.calls,
+                    "p50": latencies[len(latencies) // 2] if latencies else None,
+                    "p99": latencies[min(len(latencies) - 1, len(latencies) * 99 // 100)] if latencies else None,
+                    "error_rate": health.error_rate,
+                    "circuit": circuit,
+                })
+            return report
+
+# Cart line items
+class LineItems:
+    """
+    Columnar store for cart lines: price in integer cents, quantity and SKU id
+    are kept in three parallel arrays. Totals are computed with map/sum over
+    the arrays instead of looping over line objects.
+    Discount and tax rates are percentages; results are rounded to whole cents.
+    """
+    def __init__(self):
+        self.price_cents = array("q")
+        self.quantities = array("q")
+        self.sku_ids = array("q")
+        self._sku_ids = {None: 0}
+        self._skus = [None]
+
+    def sku_id(self, sku):
+        """Returns the id of a SKU, adding it to the table the first time it is seen."""
+        sku_id = self._sku_ids.get(sku)
+        if sku_id is None:
+            sku_id = self._sku_ids[sku] = len(self._skus)
+            self._skus.append(sku)
+        return sku_id
+
+    def add(self, price, quantity=1, sku=None):
+        """Adds one line and returns its value in cents."""
+        cents = round(price * 100)
+        start = len(self.price_cents)
+        try:
+            self.price_cents.append(cents)
+            self.quantities.append(quantity)
+            self.sku_ids.append(self.sku_id(sku))
+        except BaseException:
+            self._truncate(start)
+            raise
+        return cents * quantity
+
+    def extend(self, items):
+        """
+        Adds many lines; each item is a price or a (price, quantity, sku) tuple.
+        Returns the value of the added lines in cents. If any item is invalid,
+        none of them are added.
+        """
+        start = len(self.price_cents)
+        prices, quantities, sku_ids = self.price_cents.append, self.quantities.append, self.sku_ids.append
+        sku_id = self.sku_id
+        try:
+            for item in items:
+                if isinstance(item, tuple):
+                    price, quantity, sku = item
+                    prices(round(price * 100))
+                    quantities(quantity)
+                    sku_ids(sku_id(sku))
+                else:
+                    prices(round(item * 100))
+                    quantities(1)
+                    sku_ids(0)
+        except BaseException:
+            self._truncate(start)
+            raise
+        return sum(map(operator.mul, self.price_cents[start:], self.quantities[start:]))
+
+    def _truncate(self, length):
+        # Keeps the three columns the same length after a failed add
+        del self.price_cents[length:]
+        del self.quantities[length:]
+        del self.sku_ids[length:]
+
+    def subtotal_cents(self):
+        return sum(map(operator.mul, self.price_cents, self.quantities))
+
+    def discount_cents(self, percent, skus=None):
+        """Discount of `percent` on every line, or only on lines whose SKU is in `skus`."""
+        if skus is None:
+            base = self.subtotal_cents()
+        else:
+            wanted = {self._sku_ids[sku] for sku in skus if sku in self._sku_ids}
+            line_totals = map(operator.mul, self.price_cents, self.quantities)
+            base = sum(compress(line_totals, map(wanted.__contains__, self.sku_ids)))
+        return self._percent_of(base, percent)
+
+    def total_cents(self, discount_percent=0, discount_skus=None, tax_percent=0):
+        """Subtotal minus discount, plus tax on the discounted amount."""
+        net = self.subtotal_cents() - self.discount_cents(discount_percent, discount_skus)
+        return net + self._percent_of(net, tax_percent)
+
+    @staticmethod
+    def _percent_of(cents, percent):
+        # Basis points keep the arithmetic in integers; halves round up
+        basis_points = round(percent * 100)
+        return (cents * basis_points + 5000) // 10000
+
+    def __len__(self):
+        return len(self.price_cents)
+
 # Context class
 class ShoppingCart:
     def __init__(self):
         self.amount = 0
         self.payment_strategy = None
+        self.items = LineItems()
 
     def set_payment_strategy(self, strategy):
         """
@@ -48,9 +288,112 @@ class ShoppingCart:
         self.payment_strategy.pay(self.amount)
 
     def add_item(self, price):
+        self.items.add(price)
         self.amount += price
         print(f"Item added. Current total: ${self.amount}")
 
+    def add_items(self, items):
+        """
+        Adds many items without printing; each item is a price or a
+        (price, quantity, sku) tuple.
+        """
+        self.amount += self.items.extend(items) / 100
+
+# Benchmark
+def benchmark(lines=1_000_000):
+    """Compares adding `lines` items one by one with add_item against add_items."""
+    prices = [(i % 5000) / 100 + 0.99 for i in range(lines)]
+
+    cart = ShoppingCart()
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        start = time.perf_counter()
+        for price in prices:
+            cart.add_item(price)
+        per_call = time.perf_counter() - start
+
+    bulk_cart = ShoppingCart()
+    start = time.perf_counter()
+    bulk_cart.add_items(prices)
+    bulk = time.perf_counter() - start
+
+    start = time.perf_counter()
+    total = bulk_cart.items.total_cents(discount_percent=10, tax_percent=8.25)
+    totals = time.perf_counter() - start
+
+    assert cart.items.subtotal_cents() == bulk_cart.items.subtotal_cents()
+    print(f"add_item: {per_call:.3f}s, add_items: {bulk:.3f}s, "
+          f"discounted total with tax: {totals:.3f}s (${total / 100:,.2f}) for {lines:,} lines")
+    return per_call, bulk, totals
+
+# Batch checkout
+class CheckoutResult:
+    """
+    Outcome of one cart in a batch checkout.
+    `index` is the position of the cart in the input.
+    """
+    def __init__(self, index, cart, succeeded, attempts, error, seconds):
+        self.index = index
+        self.cart = cart
+        self.succeeded = succeeded
+        self.attempts = attempts
+        self.error = error
+        self.seconds = seconds
+
+    def __repr__(self):
+        status = "ok" if self.succeeded else f"failed: {self.error}"
+        return f"CheckoutResult(#{self.index}, {status}, attempts={self.attempts})"
+
+class BatchCheckout:
+    """
+    Checks out many carts concurrently on a bounded thread pool.
+
+    - `limits` maps a strategy class to the most calls it may have running at once.
+    - Failed payments are retried up to `retries` times with exponential backoff.
+    - At most `max_in_flight` carts are queued at a time, so millions of carts
+      can be streamed through without creating millions of futures.
+    """
+    def __init__(self, max_workers=32, limits=None, retries=2, backoff=0.05, max_in_flight=None):
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.max_in_flight = max_in_flight or max_workers * 4
+        self._limits = {strategy: threading.BoundedSemaphore(limit)
+                        for strategy, limit in (limits or {}).items()}
+
+    def run(self, carts):
+        """Yields a CheckoutResult for every cart, in the order they finish."""
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            pending = set()
+            for index, cart in enumerate(carts):
+                if len(pending) >= self.max_in_flight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+                pending.add(pool.submit(self._checkout, index, cart))
+            for future in as_completed(pending):
+                yield future.result()
+
+    def _checkout(self, index, cart):
+        start = time.perf_counter()
+        if not cart.payment_strategy:
+            return CheckoutResult(index, cart, False, 0, "Payment strategy is not set!", 0.0)
+        limit = self._limits.get(type(cart.payment_strategy))
+        error = None
+        for attempt in range(1, self.retries + 2):
+            try:
+                if limit:
+                    with limit:
+                        cart.checkout()
+                else:
+                    cart.checkout()
+                return CheckoutResult(index, cart, True, attempt, None, time.perf_counter() - start)
+            except Exception as exc:
+                error = str(exc)
+                if attempt <= self.retries:
+                    # Exponential backoff with jitter so retries do not arrive together
+                    time.sleep(self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5))
+        return CheckoutResult(index, cart, False, self.retries + 1, error, time.perf_counter() - start)
+
 # Example usage
 if __name__ == "__main__":
     cart = ShoppingCart()
@@ -70,3 +413,46 @@ if __name__ == "__main__":
     paypal = PayPalPayment("john@example.com")
     cart2.set_payment_strategy(paypal)
     cart2.checkout()
+
+    # Bulk lines with quantities and SKUs, priced from integer cents
+    cart3 = ShoppingCart()
+    cart3.add_items([(19.99, 2, "BOOK-1"), (5.00, 1, "PEN"), 3.50])
+    print(f"Subtotal: ${cart3.items.subtotal_cents() / 100:.2f}")  # Subtotal: $48.48
+    print(f"With 10% off books and 8% tax: ${cart3.items.total_cents(10, ['BOOK-1'], 8) / 100:.2f}")
+
+    if "--benchmark" in sys.argv:
+        benchmark()
+
+    print("\nSettling a batch of carts through a stub gateway...\n")
+
+    gateway = StubGatewayPayment(latency=0.02, failure_rate=0.2, seed=1)
+    carts = []
+    for price in range(1, 51):
+        cart = ShoppingCart()
+        cart.amount = price
+        cart.set_payment_strategy(gateway)
+        carts.append(cart)
+
+    batch = BatchCheckout(max_workers=8, limits={StubGatewayPayment: 4}, retries=3, backoff=0.01)
+    start = time.perf_counter()
+    results = sorted(batch.run(carts), key=lambda result: result.index)
+    succeeded = sum(result.succeeded for result in results)
+    print(f"{succeeded}/{len(results)} carts paid in {time.perf_counter() - start:.2f}s")
+    print(results[:3])
+
+    print("\nRouting payments between a fast and a degraded gateway...\n")
+
+    fast = StubGatewayPayment(latency=0.005, seed=2)
+    degraded = StubGatewayPayment(latency=0.05, failure_rate=0.5, seed=3)
+    router = StrategyRouter([degraded, fast], epsilon=0.1, cooldown=0.5)
+    carts = []
+    for price in range(1, 201):
+        cart = ShoppingCart()
+        cart.amount = price
+        cart.set_payment_strategy(router)
+        carts.append(cart)
+    results = list(BatchCheckout(max_workers=8, retries=3, backoff=0.01).run(carts))
+    print(f"{sum(result.succeeded for result in results)}/{len(results)} carts paid")
+    print(f"fast gateway: {fast.payments} payments, degraded gateway: {degraded.payments} payments")
+    for row in router.stats():
+        print(row)
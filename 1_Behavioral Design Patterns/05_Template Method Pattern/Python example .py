@@ -4,24 +4,125 @@ Template Method Design Pattern Example in Python
 This example demonstrates a basic report generation system where different types of reports
 share the same structure: fetch data -> process data -> generate report.
 The abstract class defines the template and leaves the data processing to subclasses.
+
+StreamingReportTemplate runs the same three steps as a pipeline over chunks of data.
+A StepCache lets many reports share the result of a step such as fetch_data.
+ReportRunner generates many reports in parallel processes and times every step.
 """
 
+import json
+import queue
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class StepCache:
+    """
+    Remembers step results by (step name, parameters) for `ttl` seconds,
+    keeping at most `max_entries` results (least recently used go first).
+    When several reports need the same missing result at once, only the first
+    runs the step and the others wait for its result.
+    """
+
+    def __init__(self, ttl=60.0, max_entries=128, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._in_flight = {}  # key -> Future of the running step
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0  # Callers that waited for another caller's run of the step
+        self.evictions = 0
+
+    def get_or_compute(self, key, compute):
+        owner = False
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > self._clock():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.shared += 1
+            else:
+                self.misses += 1
+                future = self._in_flight[key] = Future()
+                owner = True
+        if not owner:
+            return future.result()
+
+        try:
+            value = compute()
+        except BaseException as error:
+            with self._lock:
+                del self._in_flight[key]
+            future.set_exception(error)
+            raise
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            del self._in_flight[key]
+        future.set_result(value)
+        return value
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "shared": self.shared,
+                "evictions": self.evictions, "entries": len(self._entries)}
 
 class ReportTemplate(ABC):
     """
     Abstract base class (Template)
     Defines the algorithm's skeleton and leaves the custom steps to subclasses.
+
+    Set `step_cache` to a StepCache to share the results of the steps named in
+    `cached_steps` between reports; step results are kept in `step_results`
+    and the wall and CPU seconds of each step in `step_timings`.
     """
+    step_cache = None
+    cached_steps = ("fetch_data",)
 
     def generate_report(self):
         """
         The template method that defines the steps of the algorithm.
         This should not be overridden.
         """
-        self.fetch_data()
-        self.process_data()
-        self.export_report()
+        self.step_results = {}
+        self.step_timings = {}
+        for step_name in ("fetch_data", "process_data", "export_report"):
+            self._run_step(step_name)
+
+    def _run_step(self, step_name):
+        step = getattr(self, step_name)
+        wall_start, cpu_start = time.perf_counter(), time.thread_time()
+        if self.step_cache is not None and step_name in self.cached_steps:
+            # Subclasses that override a step must not share another class's result
+            implementation = getattr(type(self), step_name)
+            key = (implementation.__module__, implementation.__qualname__) + tuple(self.step_parameters(step_name))
+            result = self.step_cache.get_or_compute(key, step)
+        else:
+            result = step()
+        self.step_results[step_name] = result
+        self.step_timings[step_name] = {"wall": time.perf_counter() - wall_start,
+                                        "cpu": time.thread_time() - cpu_start}
+        return result
+
+    def step_parameters(self, step_name):
+        """
+        Hook method: values that change a step's result, used in its cache key.
+        Reports using the same step implementation with the same parameters
+        share cached results.
+        """
+        return ()
 
     def fetch_data(self):
         """
@@ -67,6 +168,188 @@ class InventoryReport(ReportTemplate):
         print("Exporting inventory report as Excel file.")
 
 
+# Streaming pipeline helpers
+_DONE = object()  # Marks the end of a stage's output
+
+
+class _Failed:
+    """Carries an exception from one stage to the next."""
+    def __init__(self, error):
+        self.error = error
+
+
+def _put(chunks, item, stop):
+    # Time out regularly so a stage is not stuck forever once the pipeline stops
+    while not stop.is_set():
+        try:
+            chunks.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _feed(stage, chunks, stop):
+    """Runs a stage on its own thread and puts every chunk it yields into `chunks`."""
+    try:
+        for chunk in stage:
+            if not _put(chunks, chunk, stop):
+                return
+        _put(chunks, _DONE, stop)
+    except BaseException as error:
+        _put(chunks, _Failed(error), stop)
+
+
+def _drain(chunks, stop):
+    """Yields chunks from a queue until the stage feeding it is done or the pipeline stops."""
+    while True:
+        try:
+            chunk = chunks.get(timeout=0.1)
+        except queue.Empty:
+            if stop.is_set():
+                return
+            continue
+        if chunk is _DONE:
+            return
+        if isinstance(chunk, _Failed):
+            raise chunk.error
+        yield chunk
+
+
+class StreamingReportTemplate(ReportTemplate):
+    """
+    Template for reports that are too large to hold in memory at once.
+    The steps keep their names but work on a stream of chunks:
+
+    - fetch_data() yields chunks of raw data
+    - process_data(chunks) yields processed chunks
+    - export_report(chunks) writes the processed chunks
+
+    Fetch and process run on their own threads, connected by queues holding at
+    most `queue_size` chunks, so all three steps overlap and memory use depends
+    on the chunk size instead of the report size.
+    """
+    queue_size = 4
+
+    def generate_report(self):
+        stop = threading.Event()
+        fetched = queue.Queue(maxsize=self.queue_size)
+        processed = queue.Queue(maxsize=self.queue_size)
+        stages = [
+            threading.Thread(target=_feed, args=(self.fetch_data(), fetched, stop), daemon=True),
+            threading.Thread(target=_feed, args=(self.process_data(_drain(fetched, stop)), processed, stop), daemon=True),
+        ]
+        for stage in stages:
+            stage.start()
+        try:
+            self.export_report(_drain(processed, stop))
+        finally:
+            stop.set()
+            for stage in stages:
+                stage.join()
+
+    @abstractmethod
+    def fetch_data(self):
+        pass
+
+    @abstractmethod
+    def process_data(self, chunks):
+        pass
+
+    @abstractmethod
+    def export_report(self, chunks):
+        pass
+
+
+class StreamingSalesReport(StreamingReportTemplate):
+    """
+    Sales report that reads sales in chunks and only ever keeps running totals.
+    """
+
+    def __init__(self, sales_count, chunk_size=1000):
+        self.sales_count = sales_count
+        self.chunk_size = chunk_size
+
+    def fetch_data(self):
+        print(f"Streaming {self.sales_count} sales from database...")
+        for start in range(0, self.sales_count, self.chunk_size):
+            # Stand-in for one page of query results
+            yield [(sale % 100) + 0.5 for sale in range(start, min(start + self.chunk_size, self.sales_count))]
+
+    def process_data(self, chunks):
+        for chunk in chunks:
+            yield len(chunk), sum(chunk)
+
+    def export_report(self, chunks):
+        count = revenue = 0
+        for chunk_count, chunk_revenue in chunks:
+            count += chunk_count
+            revenue += chunk_revenue
+        print(f"Exporting streamed sales report: {count} sales, revenue {revenue:.2f}")
+
+
+# Parallel runner
+def _generate_timed(index, report):
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    report.generate_report()
+    return {
+        "index": index,
+        "report": type(report).__name__,
+        "wall": time.perf_counter() - wall_start,
+        "cpu": time.process_time() - cpu_start,
+        "steps": getattr(report, "step_timings", {}),
+    }
+
+
+class ReportRunner:
+    """
+    Generates many reports in parallel on a process pool, so CPU-bound
+    process_data steps use every core, and collects the wall and CPU time of
+    each step. Reports are sent to the workers by pickling, so they must not
+    hold a step_cache (its lock cannot be pickled, and each process would
+    have its own cache anyway).
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers
+
+    def run(self, reports):
+        """Returns one timing record per report, in the order the reports were given."""
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            return list(pool.map(_generate_timed, range(len(reports)), reports))
+
+    @staticmethod
+    def format_table(results):
+        steps = ("fetch_data", "process_data", "export_report")
+        header = f"{'#':>3} {'report':<18}" + "".join(f"{step + ' wall/cpu':>26}" for step in steps)
+        rows = [header + f"{'total wall/cpu':>22}"]
+        for result in results:
+            row = f"{result['index']:>3} {result['report']:<18}"
+            for step in steps:
+                timing = result["steps"].get(step)
+                row += f"{timing['wall']:>15.4f}/{timing['cpu']:<10.4f}" if timing else f"{'-':>26}"
+            row += f"{result['wall']:>11.4f}/{result['cpu']:.4f}"
+            rows.append(row)
+        return "\n".join(rows)
+
+    @staticmethod
+    def to_json(results):
+        return json.dumps(results, indent=2)
+
+
+class ForecastReport(ReportTemplate):
+    """
+    Report whose processing step is CPU-bound, to show the parallel runner at work.
+    """
+
+    def __init__(self, size=2_000_000):
+        self.size = size
+
+    def process_data(self):
+        trend = sum(i * i % 7 for i in range(self.size))
+        print(f"Processing forecast data: trend score {trend}")
+
+
 if __name__ == "__main__":
     print("\n--- Generating Sales Report ---")
     sales = SalesReport()
@@ -75,3 +358,21 @@ if __name__ == "__main__":
     print("\n--- Generating Inventory Report ---")
     inventory = InventoryReport()
     inventory.generate_report()
+
+    print("\n--- Generating Streaming Sales Report ---")
+    streaming_sales = StreamingSalesReport(sales_count=100_000)
+    streaming_sales.generate_report()
+
+    print("\n--- Generating Reports With a Shared Fetch Cache ---")
+    cache = StepCache(ttl=30.0)
+    reports = [SalesReport() if i % 2 else InventoryReport() for i in range(6)]
+    for report in reports:
+        report.step_cache = cache
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        list(pool.map(lambda report: report.generate_report(), reports))
+    print("Cache stats:", cache.stats())  # One miss: data was fetched only once
+
+    print("\n--- Generating Reports in Parallel ---")
+    runner = ReportRunner(max_workers=4)
+    results = runner.run([ForecastReport(), ForecastReport(), SalesReport(), InventoryReport()])
+    print(runner.format_table(results))
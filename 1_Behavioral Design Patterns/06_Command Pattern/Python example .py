@@ -6,13 +6,25 @@ allowing them to be executed, undone, or stored for later.
 
 Components:
 - Command interface (Command)
-- ConcreteCommand classes (TurnOnCommand, TurnOffCommand)
+- ConcreteCommand classes (TurnOnCommand, TurnOffCommand, MacroCommand)
 - Receiver (Light)
-- Invoker (RemoteControl)
+- Invoker (RemoteControl) with a bounded CommandHistory
+- QueuedRemoteControl, an invoker that runs commands on worker threads
+- JournaledRemoteControl, an invoker that logs commands to disk and replays them on startup
 - Client code that ties everything together
+
+Run with --benchmark to compare journal fsync policies.
 """
 
+import json
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
 from abc import ABC, abstractmethod
+from collections import deque
 
 # Command Interface
 class Command(ABC):
@@ -24,12 +36,34 @@ class Command(ABC):
     def undo(self):
         pass
 
+    def inverts(self, other):
+        """True if running this command right after `other` cancels it out."""
+        return False
+
+    def repeats(self, other):
+        """True if running this command right after `other` changes nothing."""
+        return False
+
+    @property
+    def receiver(self):
+        """The object this command acts on; commands for one receiver run in order."""
+        return None
+
+    @property
+    def receivers(self):
+        """Every object this command acts on."""
+        return (self.receiver,)
+
 # Receiver Class
 class Light:
+    is_on = False
+
     def turn_on(self):
+        self.is_on = True
         print("Light is ON")
 
     def turn_off(self):
+        self.is_on = False
         print("Light is OFF")
 
 # Concrete Command to turn the light ON
@@ -43,6 +77,16 @@ class TurnOnCommand(Command):
     def undo(self):
         self.light.turn_off()
 
+    def inverts(self, other):
+        return isinstance(other, TurnOffCommand) and other.light is self.light
+
+    def repeats(self, other):
+        return isinstance(other, TurnOnCommand) and other.light is self.light
+
+    @property
+    def receiver(self):
+        return self.light
+
 # Concrete Command to turn the light OFF
 class TurnOffCommand(Command):
     def __init__(self, light: Light):
@@ -54,10 +98,80 @@ class TurnOffCommand(Command):
     def undo(self):
         self.light.turn_on()
 
+    def inverts(self, other):
+        return isinstance(other, TurnOnCommand) and other.light is self.light
+
+    def repeats(self, other):
+        return isinstance(other, TurnOffCommand) and other.light is self.light
+
+    @property
+    def receiver(self):
+        return self.light
+
+# Composite Command that executes and undoes several commands as one unit
+class MacroCommand(Command):
+    def __init__(self, commands):
+        self.commands = list(commands)
+
+    def execute(self):
+        for command in self.commands:
+            command.execute()
+
+    def undo(self):
+        for command in reversed(self.commands):
+            command.undo()
+
+    @property
+    def receiver(self):
+        return self.commands[0].receiver if self.commands else None
+
+    @property
+    def receivers(self):
+        return tuple(receiver for command in self.commands for receiver in command.receivers)
+
+# Command history kept in a ring buffer
+class CommandHistory:
+    """
+    Undo history holding at most `capacity` commands; when it is full the
+    oldest command is dropped. With `coalesce=True`, a command that cancels
+    the previous one removes both, and a repeated command is not stored again,
+    so undoing still ends in the same states with fewer steps.
+    """
+    def __init__(self, capacity=None, coalesce=False):
+        self._commands = deque(maxlen=capacity)
+        self.coalesce = coalesce
+        self.coalesced = 0  # Commands that were never stored or were removed
+
+    def append(self, command):
+        if self.coalesce and self._commands:
+            last = self._commands[-1]
+            if command.inverts(last):
+                self._commands.pop()
+                self.coalesced += 2
+                return
+            if command.repeats(last):
+                self.coalesced += 1
+                return
+        self._commands.append(command)
+
+    def pop(self):
+        return self._commands.pop()
+
+    def __len__(self):
+        return len(self._commands)
+
+    def __iter__(self):
+        """Iterates from the oldest to the newest command."""
+        return iter(self._commands)
+
+    @property
+    def capacity(self):
+        return self._commands.maxlen
+
 # Invoker Class
 class RemoteControl:
-    def __init__(self):
-        self.history = []  # Stores command history
+    def __init__(self, history_capacity=None, coalesce=False):
+        self.history = CommandHistory(history_capacity, coalesce)  # Stores command history
 
     def submit(self, command: Command):
         """
@@ -76,6 +190,401 @@ class RemoteControl:
         else:
             print("No commands to undo")
 
+# Invoker that runs commands on worker threads
+class QueuedRemoteControl(RemoteControl):
+    """
+    Invoker that hands commands to `workers` threads instead of running them
+    on the caller's thread, so a slow receiver does not hold up submitters.
+
+    - Commands for the same receiver always go to the same worker, so they run
+      in the order they were submitted. A macro whose receivers belong to
+      several workers runs on one of them while the others pause at the same
+      point in their queues.
+    - Each worker accepts at most `queue_size` pending commands. submit() waits
+      for room, or raises queue.Full after `timeout` seconds.
+    - undo_last() queues the undo behind the command it undoes, on the same worker.
+    """
+    def __init__(self, workers=4, queue_size=1000, history_capacity=None, coalesce=False):
+        super().__init__(history_capacity, coalesce)
+        self._queues = [queue.Queue() for _ in range(workers)]
+        self._slots = [threading.BoundedSemaphore(queue_size) for _ in range(workers)]
+        self._lock = threading.Lock()  # Keeps history order equal to queue order
+        self._metrics_lock = threading.Lock()
+        self._latencies = deque(maxlen=10_000)
+        self.completed = 0
+        self.failed = 0
+        self._threads = [threading.Thread(target=self._work, args=(worker,), daemon=True)
+                         for worker in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, command: Command, timeout=None):
+        """
+        Queues a command and stores it in history
+        """
+        workers = self._workers_for(command)
+        acquired = []
+        try:
+            for worker in workers:
+                if not self._slots[worker].acquire(timeout=timeout):
+                    raise queue.Full("Command queue is full")
+                acquired.append(worker)
+        except queue.Full:
+            for worker in acquired:
+                self._slots[worker].release()
+            raise
+        with self._lock:
+            self.history.append(command)
+            self._put(workers, command.execute, True)
+
+    def undo_last(self):
+        """
+        Queues the undo of the last command
+        """
+        with self._lock:
+            if not self.history:
+                print("No commands to undo")
+                return
+            command = self.history.pop()
+            # Undo does not wait for room: it is never queued more often than commands
+            self._put(self._workers_for(command), command.undo, False)
+
+    def wait(self):
+        """Blocks until every queued command has run."""
+        for commands in self._queues:
+            commands.join()
+
+    def close(self):
+        self.wait()
+        for commands in self._queues:
+            commands.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def metrics(self):
+        latencies = sorted(self._latencies)
+        return {
+            "queue_depth": sum(commands.qsize() for commands in self._queues),
+            "completed": self.completed,
+            "failed": self.failed,
+            "latency_mean_seconds": sum(latencies) / len(latencies) if latencies else 0.0,
+            "latency_p99_seconds": latencies[len(latencies) * 99 // 100] if latencies else 0.0,
+        }
+
+    def _workers_for(self, command):
+        return sorted({hash(receiver) % len(self._queues) for receiver in command.receivers})
+
+    def _put(self, workers, action, holds_slot):
+        # Called with self._lock held, so every worker queues multi-worker commands in the same order
+        queued_at = time.perf_counter()
+        first, others = workers[0], workers[1:]
+        if others:
+            started = threading.Barrier(len(workers))
+            finished = threading.Event()
+
+            def hold():
+                started.wait()
+                finished.wait()
+
+            def run(action=action):
+                started.wait()
+                try:
+                    action()
+                finally:
+                    finished.set()
+
+            for worker in others:
+                self._queues[worker].put((hold, queued_at, holds_slot, False))
+            action = run
+        self._queues[first].put((action, queued_at, holds_slot, True))
+
+    def _work(self, worker):
+        commands = self._queues[worker]
+        while True:
+            item = commands.get()
+            if item is None:
+                commands.task_done()
+                return
+            action, queued_at, holds_slot, counted = item
+            failed = False
+            try:
+                action()
+            except Exception as error:
+                failed = True
+                print(f"Command failed: {error}")
+            finally:
+                if counted:
+                    with self._metrics_lock:
+                        self.completed += not failed
+                        self.failed += failed
+                        self._latencies.append(time.perf_counter() - queued_at)
+                if holds_slot:
+                    self._slots[worker].release()
+                commands.task_done()
+
+# Durable command journal
+class CommandJournal:
+    """
+    Append-only file of JSON records, one per line.
+
+    fsync policies:
+    - "always": every record is written and fsynced before append() returns
+    - "group":  a background thread writes and fsyncs whatever records have
+                arrived since its last fsync in one batch; wait() returns
+                once a record is on disk
+    - "never":  records are only handed to the operating system
+    """
+    POLICIES = ("always", "group", "never")
+
+    def __init__(self, path, fsync="group"):
+        if fsync not in self.POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.path = path
+        self.fsync = fsync
+        if os.path.exists(path):
+            # Drop a line torn by a crash so new records do not continue it
+            os.truncate(path, self._scan(path)[1])
+        self._file = open(path, "ab")
+        self._io_lock = threading.Lock()  # Held while writing to or replacing the file
+        self._condition = threading.Condition()
+        self._pending = []
+        self._appended = 0  # Sequence number of the last appended record
+        self._durable = 0   # Sequence number of the last record on disk
+        self._closed = False
+        self.fsyncs = 0
+        self._flusher = None
+        if fsync == "group":
+            self._flusher = threading.Thread(target=self._flush_batches, daemon=True)
+            self._flusher.start()
+
+    @staticmethod
+    def read(path):
+        """Returns the records in a journal, ignoring a last line cut short by a crash."""
+        if not os.path.exists(path):
+            return []
+        return CommandJournal._scan(path)[0]
+
+    @staticmethod
+    def _scan(path):
+        """Returns the complete records in a journal and the size of the file they fill."""
+        records = []
+        size = 0
+        with open(path, "rb") as journal:
+            for line in journal:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    break
+                size += len(line)
+        return records, size
+
+    def append(self, record):
+        """Adds a record and returns its sequence number for wait()."""
+        line = (json.dumps(record) + "\n").encode("utf-8")
+        if self.fsync != "group":
+            with self._io_lock:
+                self._file.write(line)
+                self._file.flush()
+                if self.fsync == "always":
+                    os.fsync(self._file.fileno())
+                    self.fsyncs += 1
+            return 0
+        with self._condition:
+            self._pending.append(line)
+            self._appended += 1
+            self._condition.notify_all()
+            return self._appended
+
+    def wait(self, sequence):
+        """With the "group" policy, blocks until record `sequence` is on disk."""
+        if self.fsync != "group":
+            return
+        with self._condition:
+            while self._durable < sequence:
+                self._condition.wait()
+
+    def _flush_batches(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending, []
+                last = self._appended
+            with self._io_lock:
+                self._file.write(b"".join(batch))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self.fsyncs += 1
+            with self._condition:
+                self._durable = last
+                self._condition.notify_all()
+
+    def rewrite(self, records):
+        """Atomically replaces the journal with `records`."""
+        with self._condition:
+            while self._durable < self._appended:
+                self._condition.wait()
+        with self._io_lock:
+            temporary = self.path + ".compact"
+            with open(temporary, "wb") as compacted:
+                for record in records:
+                    compacted.write((json.dumps(record) + "\n").encode("utf-8"))
+                compacted.flush()
+                os.fsync(compacted.fileno())
+            self._file.close()
+            os.replace(temporary, self.path)
+            self._file = open(self.path, "ab")
+
+    def close(self):
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._flusher:
+            self._flusher.join()
+        self._file.close()
+
+
+# Command types that can be written to and read from a journal
+COMMAND_TYPES = {cls.__name__: cls for cls in (TurnOnCommand, TurnOffCommand, MacroCommand)}
+
+class JournaledRemoteControl(RemoteControl):
+    """
+    Invoker that writes every submitted command and every undo to a
+    CommandJournal before returning, so a restart can rebuild receiver state
+    and the undo history by replaying the journal.
+
+    `receivers` maps a stable name to each receiver, because the journal
+    stores names instead of objects. Every `compact_every` records the journal
+    is replaced by one snapshot of the receivers' attributes and the history.
+    """
+    def __init__(self, path, receivers, fsync="group", compact_every=10_000,
+                 history_capacity=None, coalesce=False):
+        super().__init__(history_capacity, coalesce)
+        self._receivers = dict(receivers)
+        self._names = {id(receiver): name for name, receiver in self._receivers.items()}
+        self._lock = threading.Lock()  # Keeps journal order equal to execution order
+        self.compact_every = compact_every
+        self._records_since_compaction = 0
+        self.replayed = self._replay(CommandJournal.read(path))
+        self.journal = CommandJournal(path, fsync)
+
+    def submit(self, command: Command):
+        """
+        Executes a command, stores it in history and logs it
+        """
+        with self._lock:
+            # A command that raises never reaches the history, so it is not logged either
+            super().submit(command)
+            sequence = self.journal.append({"op": "execute", "command": self._encode(command)})
+            self._after_record()
+        # Waiting outside the lock lets concurrent submits share one fsync
+        self.journal.wait(sequence)
+
+    def undo_last(self):
+        """
+        Undoes the last command and logs the undo
+        """
+        with self._lock:
+            if not self.history:
+                print("No commands to undo")
+                return
+            try:
+                super().undo_last()
+            finally:
+                # The command leaves the history even if its undo raises, so log it either way
+                sequence = self.journal.append({"op": "undo"})
+                self._after_record()
+        self.journal.wait(sequence)
+
+    def compact(self):
+        """Replaces the journal with a snapshot of the receivers and the history."""
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        # Called with self._lock held, so no command can run between snapshot and rewrite
+        self.journal.rewrite([{
+            "op": "snapshot",
+            "receivers": {name: vars(receiver) for name, receiver in self._receivers.items()},
+            "history": [self._encode(command) for command in self.history],
+        }])
+        self._records_since_compaction = 0
+
+    def close(self):
+        self.journal.close()
+
+    def _after_record(self):
+        self._records_since_compaction += 1
+        if self._records_since_compaction >= self.compact_every:
+            self._compact()
+
+    def _replay(self, records):
+        for record in records:
+            if record["op"] == "snapshot":
+                for name, state in record["receivers"].items():
+                    vars(self._receivers[name]).update(state)
+                self.history = CommandHistory(self.history.capacity, self.history.coalesce)
+                for encoded in record["history"]:
+                    self.history.append(self._decode(encoded))
+            else:
+                # A receiver that fails now must not keep the remote control from starting
+                try:
+                    if record["op"] == "execute":
+                        RemoteControl.submit(self, self._decode(record["command"]))
+                    elif record["op"] == "undo":
+                        RemoteControl.undo_last(self)
+                except Exception as error:
+                    print(f"Replaying {record['op']} failed: {error}")
+        self._records_since_compaction = len(records)
+        return len(records)
+
+    def _encode(self, command):
+        if isinstance(command, MacroCommand):
+            return {"type": "MacroCommand", "commands": [self._encode(child) for child in command.commands]}
+        return {"type": type(command).__name__, "receiver": self._names[id(command.receiver)]}
+
+    def _decode(self, encoded):
+        command_type = COMMAND_TYPES[encoded["type"]]
+        if command_type is MacroCommand:
+            return MacroCommand(self._decode(child) for child in encoded["commands"])
+        return command_type(self._receivers[encoded["receiver"]])
+
+
+def benchmark(commands=2_000, threads=8):
+    """Measures journaled commands per second for each fsync policy."""
+    class QuietLight(Light):
+        def turn_on(self):
+            self.is_on = True
+
+        def turn_off(self):
+            self.is_on = False
+
+    results = {}
+    for policy in CommandJournal.POLICIES:
+        with tempfile.TemporaryDirectory() as directory:
+            lights = {f"light{i}": QuietLight() for i in range(threads)}
+            remote = JournaledRemoteControl(os.path.join(directory, "journal"), lights, fsync=policy)
+
+            def toggle(light):
+                for i in range(commands // threads):
+                    remote.submit((TurnOnCommand if i % 2 else TurnOffCommand)(light))
+
+            workers = [threading.Thread(target=toggle, args=(light,)) for light in lights.values()]
+            start = time.perf_counter()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - start
+            remote.close()
+            results[policy] = commands / elapsed
+            print(f"{policy:>6}: {results[policy]:10,.0f} commands/s, {remote.journal.fsyncs} fsyncs")
+    return results
+
 # Client Code
 if __name__ == "__main__":
     # Receiver
@@ -96,3 +605,51 @@ if __name__ == "__main__":
     remote.undo_last()       # Output: Light is ON
     remote.undo_last()       # Output: Light is OFF
     remote.undo_last()       # Output: No commands to undo
+
+    # Bounded, coalescing history: toggles cancel out instead of piling up
+    remote = RemoteControl(history_capacity=100, coalesce=True)
+    for _ in range(3):
+        remote.submit(turn_on)
+        remote.submit(turn_off)
+    remote.submit(turn_on)
+    remote.submit(turn_on)
+    print(f"Stored commands: {len(remote.history)}, coalesced: {remote.history.coalesced}")  # 1, 7
+
+    # Macro: several commands executed and undone as one unit
+    porch_light = Light()
+    all_off = MacroCommand([TurnOffCommand(living_room_light), TurnOffCommand(porch_light)])
+    remote.submit(all_off)   # Output: Light is OFF (twice)
+    remote.undo_last()       # Output: Light is ON (twice)
+
+    # Queued invoker: commands run on worker threads, in order per light
+    class SlowLight(Light):
+        def turn_on(self):
+            time.sleep(0.01)  # A slow receiver only delays its own worker
+            super().turn_on()
+
+    remote = QueuedRemoteControl(workers=2, queue_size=10)
+    hall_light = SlowLight()
+    remote.submit(TurnOnCommand(hall_light))
+    remote.submit(TurnOffCommand(porch_light))
+    remote.undo_last()       # Queued behind the OFF command on the same worker
+    remote.wait()
+    print(remote.metrics())
+    remote.close()
+
+    # Journaled invoker: state and undo history survive a restart
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "remote.journal")
+        kitchen_light = Light()
+        remote = JournaledRemoteControl(path, {"kitchen": kitchen_light})
+        remote.submit(TurnOnCommand(kitchen_light))   # Output: Light is ON
+        remote.submit(TurnOffCommand(kitchen_light))  # Output: Light is OFF
+        remote.close()
+
+        restarted_light = Light()
+        remote = JournaledRemoteControl(path, {"kitchen": restarted_light})  # Replays ON, OFF
+        remote.undo_last()       # Output: Light is ON
+        print(f"Replayed {remote.replayed} records, light on: {restarted_light.is_on}")
+        remote.close()
+
+    if "--benchmark" in sys.argv:
+        benchmark()
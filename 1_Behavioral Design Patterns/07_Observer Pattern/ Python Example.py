@@ -4,9 +4,22 @@ Observer Pattern Example in Python
 Scenario: Weather Station
 - The WeatherStation (Subject) updates its temperature.
 - Different displays (Observers) react to this change: phone display, window display, and web dashboard.
+- ConcurrentWeatherStation delivers updates on a thread pool so a slow display cannot hold up the others.
+- RangeWeatherStation only notifies observers whose temperature range contains the new reading.
+- CoalescingWeatherStation skips readings that barely changed and does not keep displays alive.
+
+Run with --benchmark to compare RangeWeatherStation with notifying every observer.
 """
 
+import random
+import sys
+import threading
+import time
+import weakref
 from abc import ABC, abstractmethod
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # Observer Interface
 class Observer(ABC):
@@ -64,6 +77,319 @@ class WebDashboard(Observer):
     def update(self, temperature):
         print(f"[WebDashboard] Displaying temperature: {temperature}°C")
 
+# Concurrent Subject: each observer gets its own bounded mailbox
+class _Mailbox:
+    """Pending temperatures for one observer, with delivery statistics."""
+    def __init__(self, observer, size):
+        self.observer = observer
+        self.pending = deque(maxlen=size)  # (time queued, temperature); full means drop oldest
+        self.lock = threading.Lock()
+        self.scheduled = False  # True while a pool task is draining this mailbox
+        self.delivered = 0
+        self.dropped = 0
+
+class ConcurrentWeatherStation(WeatherStation):
+    """
+    Weather station whose notify() never waits for observers. Each observer
+    has a mailbox of at most `queue_size` readings and is updated on a thread
+    pool; when its mailbox is full the oldest reading is dropped. Use
+    queue_size=1 to always deliver only the latest reading.
+    An observer is only ever updated by one thread at a time, in order.
+    """
+    def __init__(self, max_workers=8, queue_size=16):
+        super().__init__()
+        self.queue_size = queue_size
+        self._mailboxes = {}  # id(observer) -> _Mailbox
+        self._pool = ThreadPoolExecutor(max_workers=max_workers)
+
+    def attach(self, observer, queue_size=None):
+        super().attach(observer)
+        self._mailboxes[id(observer)] = _Mailbox(observer, queue_size or self.queue_size)
+
+    def detach(self, observer):
+        super().detach(observer)
+        del self._mailboxes[id(observer)]
+
+    def notify(self):
+        now = time.perf_counter()
+        for mailbox in list(self._mailboxes.values()):
+            with mailbox.lock:
+                if len(mailbox.pending) == mailbox.pending.maxlen:
+                    mailbox.dropped += 1
+                mailbox.pending.append((now, self._temperature))
+                if mailbox.scheduled:
+                    continue
+                mailbox.scheduled = True
+            self._pool.submit(self._deliver, mailbox)
+
+    def _deliver(self, mailbox):
+        while True:
+            with mailbox.lock:
+                if not mailbox.pending:
+                    mailbox.scheduled = False
+                    return
+                _, temperature = mailbox.pending.popleft()
+            try:
+                mailbox.observer.update(temperature)
+            except Exception as error:
+                print(f"[{type(mailbox.observer).__name__}] update failed: {error}")
+            mailbox.delivered += 1
+
+    def lag(self):
+        """Per observer: readings waiting, readings dropped, and age of the oldest waiting reading."""
+        now = time.perf_counter()
+        report = []
+        for mailbox in list(self._mailboxes.values()):
+            with mailbox.lock:
+                oldest = mailbox.pending[0][0] if mailbox.pending else now
+                report.append({
+                    "observer": type(mailbox.observer).__name__,
+                    "pending": len(mailbox.pending),
+                    "dropped": mailbox.dropped,
+                    "delivered": mailbox.delivered,
+                    "lag_seconds": now - oldest,
+                })
+        return report
+
+    def close(self):
+        """Waits for pending deliveries and stops the thread pool."""
+        self._pool.shutdown(wait=True)
+
+# Range subscriptions: observers are only notified for temperatures they care about
+class Subscription:
+    """Handle returned by RangeWeatherStation.subscribe(); cancel() detaches in O(1)."""
+    __slots__ = ("observer", "low", "high", "active", "_station")
+
+    def __init__(self, station, observer, low, high):
+        self._station = station
+        self.observer = observer
+        self.low = low
+        self.high = high
+        self.active = True
+
+    def cancel(self):
+        if self.active:
+            self.active = False
+            self._station._cancelled += 1
+
+class _IntervalTree:
+    """
+    Static centered interval tree over subscriptions. Finding the subscriptions
+    whose [low, high] contains a temperature takes O(log n + k).
+    """
+    __slots__ = ("center", "by_low", "lows", "by_high", "negated_highs", "left", "right")
+
+    def __init__(self, subscriptions):
+        points = sorted([sub.low for sub in subscriptions] + [sub.high for sub in subscriptions])
+        self.center = center = points[len(points) // 2]
+        left, right, here = [], [], []
+        for sub in subscriptions:
+            if sub.high < center:
+                left.append(sub)
+            elif sub.low > center:
+                right.append(sub)
+            else:
+                here.append(sub)
+        # Subscriptions crossing the center, sorted so matches form a prefix
+        self.by_low = sorted(here, key=lambda sub: sub.low)
+        self.lows = [sub.low for sub in self.by_low]
+        self.by_high = sorted(here, key=lambda sub: -sub.high)
+        self.negated_highs = [-sub.high for sub in self.by_high]
+        self.left = _IntervalTree(left) if left else None
+        self.right = _IntervalTree(right) if right else None
+
+    def matching(self, value):
+        node = self
+        while node is not None:
+            if value < node.center:
+                yield from node.by_low[:bisect_right(node.lows, value)]
+                node = node.left
+            elif value > node.center:
+                yield from node.by_high[:bisect_right(node.negated_highs, -value)]
+                node = node.right
+            else:
+                yield from node.by_low
+                return
+
+class RangeWeatherStation(WeatherStation):
+    """
+    Weather station where each observer subscribes to a temperature range and
+    is only notified when the new temperature falls inside it.
+
+    Subscriptions live in interval trees whose sizes double, like a binary
+    counter: new subscriptions are gathered and turned into a tree at the next
+    notify(), merging equal-sized trees. notify() therefore costs
+    O(log^2 n + k) for k matching observers, and cancelled subscriptions are
+    dropped whenever their tree is rebuilt.
+    """
+    def __init__(self):
+        super().__init__()
+        self._trees = []  # (size, _IntervalTree), largest first
+        self._new = []
+        self._cancelled = 0  # Cancelled subscriptions still in _new or a tree
+        self._attached = {}  # id(observer) -> subscriptions made through attach()
+
+    def subscribe(self, observer, low=None, high=None):
+        """Notifies `observer` whenever low <= temperature <= high (None means unbounded)."""
+        if low is not None and high is not None and low > high:
+            raise ValueError("low must not be greater than high")
+        subscription = Subscription(self, observer,
+                                    float("-inf") if low is None else low,
+                                    float("inf") if high is None else high)
+        self._new.append(subscription)
+        return subscription
+
+    def attach(self, observer):
+        self._attached.setdefault(id(observer), []).append(self.subscribe(observer))
+
+    def detach(self, observer):
+        for subscription in self._attached.pop(id(observer)):
+            subscription.cancel()
+
+    def notify(self):
+        self._index_new()
+        temperature = self._temperature
+        for _, tree in self._trees:
+            for subscription in tree.matching(temperature):
+                if subscription.active:
+                    subscription.observer.update(temperature)
+
+    def _index_new(self):
+        if self._new:
+            pending, size = self._new, len(self._new)
+            self._new = []
+            while self._trees and self._trees[-1][0] <= size:
+                pending += self._subscriptions(self._trees.pop()[1])
+                size = len(pending)
+            live = [sub for sub in pending if sub.active]
+            self._cancelled -= len(pending) - len(live)
+            if live:
+                self._trees.append((len(live), _IntervalTree(live)))
+        total = sum(size for size, _ in self._trees)
+        if self._cancelled > total // 2 and self._cancelled:
+            # Mostly cancelled: rebuild one tree from what is left
+            live = [sub for _, tree in self._trees for sub in self._subscriptions(tree) if sub.active]
+            self._trees = [(len(live), _IntervalTree(live))] if live else []
+            self._cancelled = 0
+
+    @staticmethod
+    def _subscriptions(tree):
+        found, nodes = [], [tree]
+        while nodes:
+            node = nodes.pop()
+            found.extend(node.by_low)
+            nodes.extend(child for child in (node.left, node.right) if child)
+        return found
+
+# Coalescing Subject for fast sensors
+class CoalescingWeatherStation(WeatherStation):
+    """
+    Weather station for sensors that report far more often than displays need.
+
+    - A reading within `epsilon` of the last notified temperature is skipped.
+    - At most one notification is sent per `min_interval` seconds. Readings in
+      between are held back; the next notification (or flush()) sends the
+      latest one.
+    - Observers are held through weak references, so a display that is no
+      longer used elsewhere is dropped automatically instead of kept alive.
+    """
+    def __init__(self, epsilon=0.0, min_interval=0.0, clock=time.monotonic):
+        super().__init__()
+        self.epsilon = epsilon
+        self.min_interval = min_interval
+        self._clock = clock
+        self._observers = {}  # id(observer) -> weak reference
+        self._last_sent = None
+        self._last_sent_at = None
+        self._held_back = False
+        self.readings = 0
+        self.notifications = 0
+        self.pruned = 0
+
+    def attach(self, observer):
+        key = id(observer)
+        self._observers[key] = weakref.ref(observer, lambda ref: self._prune(key))
+
+    def detach(self, observer):
+        del self._observers[id(observer)]
+
+    def _prune(self, key):
+        if self._observers.pop(key, None) is not None:
+            self.pruned += 1
+
+    def set_temperature(self, temperature):
+        self.readings += 1
+        self._temperature = temperature
+        if self._last_sent is not None and abs(temperature - self._last_sent) <= self.epsilon:
+            self._held_back = False  # Back to what observers already have
+            return
+        if self._last_sent_at is not None and self._clock() - self._last_sent_at < self.min_interval:
+            self._held_back = True
+            return
+        super().set_temperature(temperature)
+
+    def flush(self):
+        """Sends a held-back reading once `min_interval` has passed since the last notification."""
+        if self._held_back and self._clock() - self._last_sent_at >= self.min_interval:
+            super().set_temperature(self._temperature)
+
+    def notify(self):
+        self._held_back = False
+        self._last_sent = self._temperature
+        self._last_sent_at = self._clock()
+        self.notifications += 1
+        for ref in list(self._observers.values()):
+            observer = ref()
+            if observer is not None:
+                observer.update(self._temperature)
+
+    def stats(self):
+        return {
+            "readings": self.readings,
+            "notifications": self.notifications,
+            "notifications_saved": self.readings - self.notifications,
+            "observers": len(self._observers),
+            "pruned_observers": self.pruned,
+        }
+
+def benchmark(sizes=(10_000, 100_000, 1_000_000), readings=100):
+    """
+    Time per reading when each observer only cares about temperatures above its
+    own threshold: a plain WeatherStation whose observers check the threshold
+    themselves, against a RangeWeatherStation that only calls matching observers.
+    """
+    class ThresholdDisplay(Observer):
+        def __init__(self, threshold):
+            self.threshold = threshold
+            self.alerts = 0
+
+        def update(self, temperature):
+            if temperature >= self.threshold:
+                self.alerts += 1
+
+    generator = random.Random(0)
+    for size in sizes:
+        displays = [ThresholdDisplay(generator.uniform(0, 1000)) for _ in range(size)]
+        temperatures = [generator.uniform(0, 10) for _ in range(readings)]  # About 1% match
+
+        plain = WeatherStation()
+        for display in displays:
+            plain.attach(display)
+        indexed = RangeWeatherStation()
+        for display in displays:
+            indexed.subscribe(display, low=display.threshold)
+        indexed.notify()  # Build the index before timing
+
+        timings = []
+        for station in (plain, indexed):
+            start = time.perf_counter()
+            for temperature in temperatures:
+                station._temperature = temperature  # Skip the print in set_temperature
+                station.notify()
+            timings.append((time.perf_counter() - start) / readings)
+        print(f"{size:>9,} observers: notify all {timings[0] * 1e3:9.3f} ms, "
+              f"range index {timings[1] * 1e3:9.3f} ms per reading")
+
 # Client code to demonstrate the Observer Pattern
 if __name__ == "__main__":
     station = WeatherStation()
@@ -85,6 +411,42 @@ if __name__ == "__main__":
     station.detach(window)
     station.set_temperature(22)
 
+    # Concurrent delivery: a slow dashboard only falls behind itself
+    class SlowDashboard(WebDashboard):
+        def update(self, temperature):
+            time.sleep(0.05)
+            super().update(temperature)
+
+    concurrent_station = ConcurrentWeatherStation(queue_size=2)
+    concurrent_station.attach(PhoneDisplay())
+    concurrent_station.attach(SlowDashboard())
+    for temperature in (20, 21, 22, 23, 24):
+        concurrent_station.set_temperature(temperature)
+    for row in concurrent_station.lag():
+        print(row)
+    concurrent_station.close()
+
+    # Range subscriptions: the web dashboard only wants heat alerts
+    range_station = RangeWeatherStation()
+    range_station.attach(PhoneDisplay())
+    alert = range_station.subscribe(WebDashboard(), low=30)
+    range_station.set_temperature(25)  # Only the phone display is notified
+    range_station.set_temperature(31)  # Both are notified
+    alert.cancel()
+    range_station.set_temperature(35)  # Only the phone display again
+
+    # Coalescing: small changes are skipped and dropped displays are pruned
+    fast_station = CoalescingWeatherStation(epsilon=0.5)
+    phone = PhoneDisplay()
+    fast_station.attach(phone)
+    fast_station.attach(WindowDisplay())  # Not referenced anywhere else: pruned right away
+    for temperature in (20.0, 20.1, 20.3, 21.0, 21.2):
+        fast_station.set_temperature(temperature)  # Only 20.0 and 21.0 are sent
+    print(fast_station.stats())
+
+    if "--benchmark" in sys.argv:
+        benchmark()
+
 """
 Explanation:
 - We use abstract base classes for Observer and Subject to define required interfaces.
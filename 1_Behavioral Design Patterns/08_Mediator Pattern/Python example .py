@@ -5,10 +5,26 @@ This example demonstrates the Mediator Pattern using a simple chat room scenario
 Users (colleagues) communicate through a central ChatRoom (mediator),
 not directly with each other.
 
+InboxChatRoom is a mediator for very large rooms: a message is stored once and
+each user reads it from their own bounded inbox when they are ready.
+ChatServer is an asyncio mediator that serves users connected over TCP.
+A MessageLog keeps a ChatRoom's messages on disk so late joiners can page
+through its history.
+Run with --benchmark to compare InboxChatRoom with ChatRoom and to load test ChatServer.
+
 Suitable for: Learning and demonstration purposes.
 """
 
-from typing import List
+import asyncio
+import bisect
+import json
+import os
+import struct
+import sys
+import tempfile
+import time
+from collections import deque
+from typing import List, NamedTuple
 
 # Mediator Interface
 class ChatMediator:
@@ -18,13 +34,20 @@ class ChatMediator:
 
 # Concrete Mediator
 class ChatRoom(ChatMediator):
-    def __init__(self):
+    def __init__(self, message_log=None):
         self.participants = []  # List of all users in the chatroom
+        self.message_log = message_log  # Optional MessageLog keeping every message
 
     def register(self, user):
         self.participants.append(user)
 
+    def history(self, since_seq=None, before_ts=None, limit=50):
+        """Pages through logged messages; see MessageLog.history()."""
+        return self.message_log.history(since_seq=since_seq, before_ts=before_ts, limit=limit)
+
     def show_message(self, sender, message):
+        if self.message_log is not None:
+            self.message_log.append(sender.name, message)
         # Notify all users except the sender
         for user in self.participants:
             if user != sender:
@@ -45,6 +68,585 @@ class User:
     def receive(self, sender_name: str, message: str):
         print(f"[{sender_name}] to {self.name}: {message}")
 
+    def receive_many(self, messages):
+        """Receives a batch of messages; override to handle them all at once."""
+        for message in messages:
+            self.receive(message.sender.name, message.text)
+
+
+# Mediator for large rooms: one shared log, one bounded inbox per user
+class Message(NamedTuple):
+    seq: int
+    sender: User
+    text: str
+
+
+class Inbox:
+    """
+    A user's view of the room log. It remembers the next message the user has
+    not read; if the user falls more than the room's inbox size behind, the
+    oldest unread messages are dropped and counted in `dropped`.
+    """
+    def __init__(self, room, user, next_seq):
+        self._room = room
+        self.user = user
+        self._next_seq = next_seq
+        self.dropped = 0
+
+    @property
+    def pending(self):
+        """Messages not read yet, counting the user's own (skipped when read)."""
+        return self._room._next_seq - max(self._next_seq, self._room._first_seq)
+
+    def receive_many(self, limit=None):
+        """
+        Returns up to `limit` unread messages from other users, oldest first,
+        and marks them read. The user's own messages are skipped and do not
+        count towards `limit`.
+        """
+        room = self._room
+        if self._next_seq < room._first_seq:
+            self.dropped += room._first_seq - self._next_seq
+            self._next_seq = room._first_seq
+        user = self.user
+        log, end = room._log, len(room._log)
+        start = self._next_seq - room._log_offset
+        if limit is None:
+            self._next_seq += end - start
+            return [message for message in log[start:] if message.sender is not user]
+        messages = []
+        while start < end and len(messages) < limit:
+            # Read a window of the messages still wanted, then top up if some were the user's own
+            stop = min(end, start + limit - len(messages))
+            messages.extend(message for message in log[start:stop] if message.sender is not user)
+            self._next_seq += stop - start
+            start = stop
+        return messages
+
+    def drain(self, limit=None):
+        """Delivers unread messages to the user through User.receive_many()."""
+        messages = self.receive_many(limit)
+        if messages:
+            self.user.receive_many(messages)
+        return len(messages)
+
+
+class InboxChatRoom(ChatMediator):
+    """
+    Chat room that stores each message once, as an immutable Message, in a
+    log shared by every inbox. Sending is O(1) no matter how many users are in
+    the room; each user reads from their inbox on their own schedule. Only the
+    last `inbox_size` messages are kept.
+    """
+    def __init__(self, inbox_size=1000):
+        self.inbox_size = inbox_size
+        self.participants = []
+        self._inboxes = {}  # id(user) -> Inbox
+        self._log = []
+        self._log_offset = 0  # seq of _log[0]
+        self._first_seq = 0   # Oldest seq still readable
+        self._next_seq = 0
+
+    def register(self, user):
+        if id(user) in self._inboxes:
+            return
+        self.participants.append(user)
+        self._inboxes[id(user)] = Inbox(self, user, self._next_seq)
+
+    def inbox(self, user):
+        return self._inboxes[id(user)]
+
+    def show_message(self, sender, message):
+        self._log.append(Message(self._next_seq, sender, message))
+        self._next_seq += 1
+        self._first_seq = max(self._first_seq, self._next_seq - self.inbox_size)
+        if len(self._log) >= 2 * self.inbox_size:
+            # Trim in bulk so each message is moved at most once
+            excess = self._first_seq - self._log_offset
+            del self._log[:excess]
+            self._log_offset += excess
+
+
+# Persistent message history: append-only segment files with sparse indexes
+RECORD_HEADER = struct.Struct(">QdI")  # seq, timestamp, payload length
+
+
+class LoggedMessage(NamedTuple):
+    seq: int
+    ts: float
+    sender: str
+    text: str
+
+
+class _Segment:
+    """
+    One segment file holding consecutive messages. Only every `index_every`-th
+    record's seq, timestamp and file offset are kept in memory.
+    """
+    def __init__(self, path, first_seq):
+        self.path = path
+        self.first_seq = first_seq
+        self.last_seq = first_seq - 1
+        self.last_ts = 0.0
+        self.size = 0
+        self.index_seqs = []
+        self.index_ts = []
+        self.index_offsets = []
+
+    def add(self, seq, ts, offset, length, index_every):
+        if (seq - self.first_seq) % index_every == 0:
+            self.index_seqs.append(seq)
+            self.index_ts.append(ts)
+            self.index_offsets.append(offset)
+        self.last_seq = seq
+        self.last_ts = ts
+        self.size = offset + RECORD_HEADER.size + length
+
+    def offset_for_seq(self, seq):
+        """File offset of the indexed record at or before `seq`."""
+        return self.index_offsets[bisect.bisect_right(self.index_seqs, seq) - 1]
+
+    def offset_for_ts(self, ts):
+        """File offset of the indexed record just before the first one at or after `ts`."""
+        return self.index_offsets[max(bisect.bisect_left(self.index_ts, ts) - 1, 0)]
+
+
+class MessageLog:
+    """
+    Append-only message store split into segment files of about
+    `segment_bytes` each. Messages get consecutive seqs starting at 1 and
+    non-decreasing timestamps. A lookup bisects the segments, then the
+    segment's sparse index, and reads at most `index_every` record headers
+    before the first wanted message, so history() is O(log n + limit) and
+    never loads a whole segment.
+    """
+    def __init__(self, directory, segment_bytes=4 << 20, index_every=64, clock=time.time):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.index_every = index_every
+        self._clock = clock
+        os.makedirs(directory, exist_ok=True)
+        self._segments = []
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(".log"):
+                segment = self._load_segment(name)
+                if segment.last_seq < segment.first_seq:
+                    os.remove(segment.path)  # Nothing was written to it
+                else:
+                    self._segments.append(segment)
+        self._first_seqs = [segment.first_seq for segment in self._segments]
+        self._file = None
+        if self._segments:
+            self._file = open(self._segments[-1].path, "ab")
+
+    @property
+    def last_seq(self):
+        return self._segments[-1].last_seq if self._segments else 0
+
+    def _load_segment(self, name):
+        # Rebuild the sparse index from the record headers, skipping payloads
+        segment = _Segment(os.path.join(self.directory, name), int(name[:-4]))
+        with open(segment.path, "rb") as file:
+            file_size = os.fstat(file.fileno()).st_size
+            offset = 0
+            while offset + RECORD_HEADER.size <= file_size:
+                file.seek(offset)
+                seq, ts, length = RECORD_HEADER.unpack(file.read(RECORD_HEADER.size))
+                if offset + RECORD_HEADER.size + length > file_size:
+                    break
+                segment.add(seq, ts, offset, length, self.index_every)
+                offset = segment.size
+        if segment.size < file_size:
+            # Drop a record torn by a crash in the middle of an append
+            os.truncate(segment.path, segment.size)
+        return segment
+
+    def append(self, sender, text):
+        """Appends a message and returns its seq."""
+        segment = self._segments[-1] if self._segments else None
+        if segment is None or segment.size >= self.segment_bytes:
+            segment = self._roll()
+        seq = segment.last_seq + 1
+        ts = max(self._clock(), segment.last_ts)
+        payload = json.dumps({"sender": sender, "text": text}).encode("utf-8")
+        self._file.write(RECORD_HEADER.pack(seq, ts, len(payload)) + payload)
+        self._file.flush()
+        segment.add(seq, ts, segment.size, len(payload), self.index_every)
+        return seq
+
+    def _roll(self):
+        first_seq = self.last_seq + 1
+        segment = _Segment(os.path.join(self.directory, f"{first_seq:020d}.log"), first_seq)
+        if self._segments:
+            segment.last_ts = self._segments[-1].last_ts
+        if self._file is not None:
+            self._file.close()
+        self._file = open(segment.path, "ab")
+        self._segments.append(segment)
+        self._first_seqs.append(first_seq)
+        return segment
+
+    def history(self, since_seq=None, before_ts=None, limit=50):
+        """
+        Returns up to `limit` messages, oldest first:
+        - since_seq: the first messages after that seq (page forward)
+        - before_ts: the last messages sent before that time (page backward)
+        - neither: the latest messages
+        Both together return the first messages after since_seq sent before before_ts.
+        """
+        last = self.last_seq if before_ts is None else self._first_seq_at(before_ts) - 1
+        if since_seq is None:
+            first = max(last - limit + 1, 1)
+        else:
+            first = since_seq + 1
+            last = min(last, since_seq + limit)
+        return self._read(first, last)
+
+    def _first_seq_at(self, ts):
+        """Seq of the first message sent at or after `ts` (last_seq + 1 if none)."""
+        position = self._segment_for_ts(ts)
+        if position == len(self._segments):
+            return self.last_seq + 1
+        segment = self._segments[position]
+        with open(segment.path, "rb") as file:
+            for seq, record_ts, _ in self._scan(file, segment.offset_for_ts(ts), segment.size):
+                if record_ts >= ts:
+                    return seq
+        return segment.last_seq + 1
+
+    def _segment_for_ts(self, ts):
+        # First segment whose last message is at or after `ts`; timestamps never decrease
+        low, high = 0, len(self._segments)
+        while low < high:
+            middle = (low + high) // 2
+            if self._segments[middle].last_ts < ts:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    @staticmethod
+    def _scan(file, offset, end):
+        """Yields (seq, ts, payload length) for each record from `offset`, reading headers only."""
+        while offset < end:
+            file.seek(offset)
+            seq, ts, length = RECORD_HEADER.unpack(file.read(RECORD_HEADER.size))
+            yield seq, ts, length
+            offset += RECORD_HEADER.size + length
+
+    def _read(self, first, last):
+        messages = []
+        position = max(bisect.bisect_right(self._first_seqs, first) - 1, 0)
+        while first <= last and position < len(self._segments):
+            segment = self._segments[position]
+            with open(segment.path, "rb") as file:
+                for seq, ts, length in self._scan(file, segment.offset_for_seq(first), segment.size):
+                    if seq > last:
+                        break
+                    if seq >= first:
+                        # _scan left the file positioned at this record's payload
+                        payload = json.loads(file.read(length))
+                        messages.append(LoggedMessage(seq, ts, payload["sender"], payload["text"]))
+            first = segment.last_seq + 1
+            position += 1
+        return messages
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# Mediator over TCP: every frame is a 4-byte big-endian length followed by JSON
+FRAME_HEADER = struct.Struct(">I")
+
+
+def encode_frame(payload):
+    data = json.dumps(payload).encode("utf-8")
+    return FRAME_HEADER.pack(len(data)) + data
+
+
+class ProtocolError(ValueError):
+    """A client sent a frame that does not follow the chat protocol."""
+
+
+async def read_frame(reader, max_size=1 << 20):
+    size = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))[0]
+    if size > max_size:
+        raise ProtocolError(f"Frame of {size} bytes is too large")
+    try:
+        return json.loads(await reader.readexactly(size))
+    except ValueError as error:  # Invalid UTF-8 or JSON
+        raise ProtocolError(f"Frame is not valid JSON: {error}") from None
+
+
+def frame_field(frame, frame_type, field):
+    """Returns the string `field` of a `frame_type` frame, or raises ProtocolError."""
+    if not isinstance(frame, dict) or frame.get("type") != frame_type:
+        raise ProtocolError(f"Expected a {frame_type!r} frame")
+    value = frame.get(field)
+    if not isinstance(value, str):
+        raise ProtocolError(f"{frame_type!r} frame needs a string {field!r}")
+    return value
+
+
+class RemoteUser(User):
+    """Colleague for a user connected over TCP; receive() queues a frame for them."""
+    def __init__(self, name: str, mediator: ChatMediator, connection):
+        self.connection = connection
+        super().__init__(name, mediator)
+
+    def receive(self, sender_name: str, message: str):
+        self.connection.send({"type": "message", "sender": sender_name, "text": message})
+
+
+class _Connection:
+    """
+    One client connection. Outgoing frames are collected in a buffer and
+    written in batches by a single writer task. If the client reads too slowly
+    and the buffer exceeds `max_buffer` bytes, or a write does not drain within
+    `drain_timeout` seconds, the client is evicted.
+    """
+    def __init__(self, server, reader, writer):
+        self.server = server
+        self.reader = reader
+        self.writer = writer
+        self.user = None
+        self.closed = False
+        self._outgoing = deque()
+        self._outgoing_bytes = 0
+        self._ready = asyncio.Event()
+
+    def send(self, payload):
+        self.send_frame(encode_frame(payload))
+
+    def send_frame(self, frame):
+        if self.closed:
+            return
+        if self._outgoing_bytes + len(frame) > self.server.max_buffer:
+            self.server.evict(self, "send buffer full")
+            return
+        self._outgoing.append(frame)
+        self._outgoing_bytes += len(frame)
+        self._ready.set()
+
+    async def write_frames(self):
+        while not self.closed:
+            await self._ready.wait()
+            self._ready.clear()
+            if not self._outgoing:
+                continue
+            batch = b"".join(self._outgoing)
+            self._outgoing.clear()
+            self._outgoing_bytes = 0
+            try:
+                self.writer.write(batch)
+                # Waiting for the socket buffer to empty is the per-connection backpressure
+                await asyncio.wait_for(self.writer.drain(), self.server.drain_timeout)
+            except asyncio.TimeoutError:
+                self.server.evict(self, "too slow to read")
+            except ConnectionError:
+                self.server.evict(self, "connection lost")
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+        self.writer.close()
+
+
+class ChatServer(ChatMediator):
+    """
+    Asyncio chat room mediator that serves users over local TCP sockets.
+    A client first sends {"type": "join", "name": ...}, then
+    {"type": "message", "text": ...} frames; everyone else in the room
+    receives {"type": "message", "sender": ..., "text": ...}.
+    A client that does not join within `join_timeout` seconds is disconnected.
+    """
+    def __init__(self, host="127.0.0.1", port=0, max_buffer=1 << 20, drain_timeout=5.0,
+                 join_timeout=10.0):
+        self.host = host
+        self.port = port
+        self.max_buffer = max_buffer
+        self.drain_timeout = drain_timeout
+        self.join_timeout = join_timeout
+        self.participants = []
+        self.evicted = 0
+        self._server = None
+        self._connections = {}  # _Connection -> task serving it, joined or not
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        for connection in list(self._connections):
+            connection.close()
+        self._server.close()
+        # Closed connections make their handlers stop reading; wait for them to finish
+        await asyncio.gather(*self._connections.values(), return_exceptions=True)
+        await self._server.wait_closed()
+
+    def register(self, user):
+        if user not in self.participants:
+            self.participants.append(user)
+
+    def unregister(self, user):
+        if user in self.participants:
+            self.participants.remove(user)
+
+    def show_message(self, sender, message):
+        # Encode the frame once and queue the same bytes for every other user
+        frame = encode_frame({"type": "message", "sender": sender.name, "text": message})
+        for user in list(self.participants):
+            if user is not sender:
+                user.connection.send_frame(frame)
+
+    def evict(self, connection, reason):
+        if connection.closed:
+            return
+        self.evicted += 1
+        print(f"[ChatServer] Evicting {connection.user.name if connection.user else 'client'}: {reason}")
+        if connection.user:
+            self.unregister(connection.user)
+        connection.close()
+
+    async def _serve(self, reader, writer):
+        connection = _Connection(self, reader, writer)
+        self._connections[connection] = asyncio.current_task()
+        writer_task = asyncio.create_task(connection.write_frames())
+        try:
+            try:
+                join = await asyncio.wait_for(read_frame(reader), self.join_timeout)
+            except asyncio.TimeoutError:
+                raise ProtocolError("No join frame received in time") from None
+            name = frame_field(join, "join", "name")
+            connection.user = RemoteUser(name, self, connection)
+            while not connection.closed:
+                text = frame_field(await read_frame(reader), "message", "text")
+                self.show_message(connection.user, text)
+        except ProtocolError as error:
+            print(f"[ChatServer] Closing connection: {error}")
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            if connection.user:
+                self.unregister(connection.user)
+            connection.close()
+            writer_task.cancel()
+            del self._connections[connection]
+
+
+class ChatClient:
+    """Minimal client for ChatServer, used by the example and the load generator."""
+    def __init__(self, name):
+        self.name = name
+        self.reader = None
+        self.writer = None
+
+    async def connect(self, host, port):
+        self.reader, self.writer = await asyncio.open_connection(host, port)
+        self.writer.write(encode_frame({"type": "join", "name": self.name}))
+        await self.writer.drain()
+
+    async def send(self, text):
+        self.writer.write(encode_frame({"type": "message", "text": text}))
+        await self.writer.drain()
+
+    async def receive(self):
+        return await read_frame(self.reader)
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+async def load_test(clients=2_000, senders=10, messages=10, timeout=60.0):
+    """
+    Connects `clients` loopback clients to a ChatServer, lets `senders` of them
+    send `messages` messages each, and reports delivery latency percentiles.
+    """
+    server = ChatServer()
+    await server.start()
+    members = [ChatClient(f"client{i}") for i in range(clients)]
+    for start in range(0, clients, 200):
+        await asyncio.gather(*(member.connect(server.host, server.port) for member in members[start:start + 200]))
+    while len(server.participants) < clients:
+        await asyncio.sleep(0.01)
+
+    latencies = []
+    expected_per_client = [senders * messages - (messages if i < senders else 0) for i in range(clients)]
+
+    async def collect(member, expected):
+        for _ in range(expected):
+            frame = await member.receive()
+            latencies.append(time.perf_counter() - float(frame["text"]))
+
+    readers = [asyncio.create_task(collect(member, expected))
+               for member, expected in zip(members, expected_per_client)]
+    for _ in range(messages):
+        for member in members[:senders]:
+            await member.send(repr(time.perf_counter()))
+        await asyncio.sleep(0)
+    await asyncio.wait_for(asyncio.gather(*readers), timeout)
+
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[len(latencies) * 99 // 100]
+    print(f"ChatServer: {clients:,} clients, {len(latencies):,} deliveries, "
+          f"p50 {p50 * 1e3:.1f} ms, p99 {p99 * 1e3:.1f} ms, evicted {server.evicted}")
+    for member in members:
+        await member.close()
+    await server.close()
+    return p50, p99
+
+
+def benchmark(users=50_000, messages=200):
+    """Messages per second sent into a room of `users` quiet users, for both mediators."""
+    class QuietUser(User):
+        received = 0
+
+        def send(self, message: str):
+            self.mediator.show_message(self, message)
+
+        def receive(self, sender_name: str, message: str):
+            self.received += 1
+
+        def receive_many(self, messages):
+            self.received += len(messages)
+
+    for room in (ChatRoom(), InboxChatRoom(inbox_size=messages)):
+        members = [QuietUser(f"user{i}", room) for i in range(users)]
+        start = time.perf_counter()
+        for i in range(messages):
+            members[i % users].send(f"message {i}")
+        sent = time.perf_counter() - start
+        line = f"{type(room).__name__:>13}: {messages / sent:12,.0f} messages/s sent"
+        if isinstance(room, InboxChatRoom):
+            start = time.perf_counter()
+            for member in members:
+                room.inbox(member).drain()
+            line += f", all inboxes drained in {time.perf_counter() - start:.2f}s"
+        print(line)
+
+
+def benchmark_history(messages=200_000, pages=1000, limit=50):
+    """Append rate and history() page latency for a MessageLog of `messages` messages."""
+    with tempfile.TemporaryDirectory() as directory:
+        ticks = iter(range(1, messages + 1))  # One tick per message makes before_ts pages predictable
+        log = MessageLog(directory, segment_bytes=1 << 20, clock=lambda: float(next(ticks)))
+        start = time.perf_counter()
+        for i in range(messages):
+            log.append(f"user{i % 100}", f"message {i}")
+        appended = time.perf_counter() - start
+        start = time.perf_counter()
+        for page in range(pages):
+            log.history(since_seq=page * (messages // pages), limit=limit)
+            log.history(before_ts=float(page * (messages // pages)), limit=limit)
+        paged = time.perf_counter() - start
+        print(f"MessageLog: {messages / appended:,.0f} appends/s over {len(log._segments)} segments, "
+              f"{paged / (2 * pages) * 1e6:.0f} us per page of {limit}")
+        log.close()
+
 
 # Client Code
 if __name__ == "__main__":
@@ -58,6 +660,53 @@ if __name__ == "__main__":
     bob.send("Hi Alice!")
     charlie.send("Good to see you all.")
 
+    # Inbox delivery: messages wait in each user's inbox until they read them
+    big_room = InboxChatRoom(inbox_size=100)
+    dave = User("Dave", big_room)
+    erin = User("Erin", big_room)
+    dave.send("Hello from the big room!")
+    dave.send("Anyone here?")
+    print(f"Erin has {big_room.inbox(erin).pending} unread messages")
+    big_room.inbox(erin).drain()
+
+    # A logged room: late joiners page through history instead of missing it
+    with tempfile.TemporaryDirectory() as log_directory:
+        logged_room = ChatRoom(message_log=MessageLog(log_directory, segment_bytes=256))
+        heidi = User("Heidi", logged_room)
+        for i in range(10):
+            heidi.send(f"Update {i}")
+        page = logged_room.history(since_seq=0, limit=4)
+        while page:
+            print("History page:", ", ".join(f"#{m.seq} {m.text}" for m in page))
+            page = logged_room.history(since_seq=page[-1].seq, limit=4)
+        latest = logged_room.history(limit=2)
+        earlier = logged_room.history(before_ts=latest[0].ts, limit=2)
+        print("Latest:", [m.text for m in latest], "before that:", [m.text for m in earlier])
+        logged_room.message_log.close()
+
+    # Users connected over TCP, with the server as their mediator
+    async def tcp_demo():
+        server = ChatServer()
+        await server.start()
+        frank, grace = ChatClient("Frank"), ChatClient("Grace")
+        await frank.connect(server.host, server.port)
+        await grace.connect(server.host, server.port)
+        while len(server.participants) < 2:
+            await asyncio.sleep(0.01)
+        await frank.send("Hello over TCP!")
+        frame = await grace.receive()
+        print(f"[{frame['sender']}] to Grace: {frame['text']}")
+        await frank.close()
+        await grace.close()
+        await server.close()
+
+    asyncio.run(tcp_demo())
+
+    if "--benchmark" in sys.argv:
+        benchmark()
+        benchmark_history()
+        asyncio.run(load_test())
+
 """
 Explanation:
 